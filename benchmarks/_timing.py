@@ -0,0 +1,22 @@
+"""Timing helpers shared by the benchmarks."""
+
+import time
+
+import torch
+
+
+def sync(device: torch.device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def time_per_call(fn, iters: int, device: torch.device, warmup: int = 10) -> float:
+    """Mean seconds per `fn()` call over `iters` calls, after `warmup` untimed ones."""
+    for _ in range(warmup):
+        fn()
+    sync(device)
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    sync(device)
+    return (time.perf_counter() - start) / iters
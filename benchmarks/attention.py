@@ -0,0 +1,58 @@
+"""
+Single-token decode attention at several context lengths: the previous sequence-major cache (unbind + transposes
++ SDPA) against the head-major cache with SDPA.
+
+Usage:
+    python -m benchmarks.attention --device cpu --contexts 100 1000 2500
+"""
+
+import argparse
+
+import torch
+import torch.nn.functional as F
+
+from benchmarks._timing import time_per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--dtype", default="bfloat16")
+    parser.add_argument("--batch-size", type=int, default=2, help="Includes the CFG rows.")
+    parser.add_argument("--num-heads", type=int, default=16)
+    parser.add_argument("--num-heads-kv", type=int, default=4)
+    parser.add_argument("--head-dim", type=int, default=128)
+    parser.add_argument("--contexts", type=int, nargs="+", default=[100, 1000, 2500])
+    parser.add_argument("--max-seqlen", type=int, default=2880)
+    parser.add_argument("--iters", type=int, default=200)
+    args = parser.parse_args()
+
+    device, dtype = torch.device(args.device), getattr(torch, args.dtype)
+    bsz, h, h_kv, d = args.batch_size, args.num_heads, args.num_heads_kv, args.head_dim
+
+    seq_major = torch.randn(bsz, args.max_seqlen, 2, h_kv, d, device=device, dtype=dtype)
+    head_major = seq_major.permute(0, 2, 3, 1, 4).contiguous()  # (bsz, 2, h_kv, max_seqlen, d)
+    q = torch.randn(bsz, h, 1, d, device=device, dtype=dtype)
+
+    for context in args.contexts:
+
+        def sequence_major():
+            k, v = seq_major[:, :context].unbind(dim=-3)
+            k, v = k.transpose(1, 2), v.transpose(1, 2)
+            return F.scaled_dot_product_attention(q, k, v, enable_gqa=True)
+
+        k, v = head_major[:, 0, :, :context], head_major[:, 1, :, :context]
+        variants = {
+            "seq-major sdpa": sequence_major,
+            "head-major sdpa": lambda: F.scaled_dot_product_attention(q, k, v, enable_gqa=True),
+        }
+
+        reference = sequence_major().float()
+        print(f"context {context}:")
+        for name, fn in variants.items():
+            err = (fn().float() - reference).abs().max().item()
+            print(f"  {name:>18}: {time_per_call(fn, args.iters, device) * 1e6:9.1f} us  (max abs diff {err:.1e})")
+
+
+if __name__ == "__main__":
+    main()
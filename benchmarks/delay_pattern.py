@@ -0,0 +1,80 @@
+"""
+Checks the gather-based delay pattern utilities against the original pad/roll/stack versions and times both.
+
+Usage:
+    python -m benchmarks.delay_pattern --device cpu --seq-len 2580
+"""
+
+import argparse
+
+import torch
+import torch.nn.functional as F
+
+from benchmarks._timing import time_per_call
+from zonos.codebook_pattern import (
+    apply_delay_pattern,
+    num_complete_frames,
+    revert_delay_pattern,
+    revert_delay_pattern_frames,
+)
+
+
+def apply_delay_pattern_reference(codes: torch.Tensor, mask_token: int):
+    codes = F.pad(codes, (0, codes.shape[1]), value=mask_token)
+    return torch.stack([codes[:, k].roll(k + 1) for k in range(codes.shape[1])], dim=1)
+
+
+def revert_delay_pattern_reference(codes: torch.Tensor):
+    _, n_q, seq_len = codes.shape
+    return torch.stack([codes[:, k, k + 1 : seq_len - n_q + k + 1] for k in range(n_q)], dim=1)
+
+
+def check_equivalence(device: torch.device, mask_token: int = 1025):
+    for batch_size, seq_len in [(1, 1), (1, 7), (2, 9), (3, 100), (2, 2580)]:
+        codes = torch.randint(0, 1024, (batch_size, 9, seq_len), device=device)
+        delayed = apply_delay_pattern(codes, mask_token)
+        assert torch.equal(delayed, apply_delay_pattern_reference(codes, mask_token))
+        assert torch.equal(revert_delay_pattern(delayed), revert_delay_pattern_reference(delayed))
+        assert torch.equal(revert_delay_pattern(delayed), codes)
+
+        out = torch.empty_like(delayed)
+        assert apply_delay_pattern(codes, mask_token, out=out) is out
+
+        # Incremental reverts over growing prefixes must stitch back into the full revert.
+        chunks, done = [], 0
+        for delayed_len in range(1, delayed.shape[2] + 1, 5):
+            ready = num_complete_frames(delayed_len, 9)
+            if ready > done:
+                chunks.append(revert_delay_pattern_frames(delayed, done, ready))
+                done = ready
+        chunks.append(revert_delay_pattern_frames(delayed, done, seq_len))
+        assert torch.equal(torch.cat(chunks, dim=2), codes)
+    print("gather-based delay pattern matches the reference implementation")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--seq-len", type=int, default=2580)
+    parser.add_argument("--iters", type=int, default=200)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    check_equivalence(device)
+
+    codes = torch.randint(0, 1024, (args.batch_size, 9, args.seq_len), device=device)
+    delayed = apply_delay_pattern(codes, 1025)
+    out = torch.empty_like(delayed)
+    timings = {
+        "apply (reference)": lambda: apply_delay_pattern_reference(codes, 1025),
+        "apply (gather, out=)": lambda: apply_delay_pattern(codes, 1025, out=out),
+        "revert (reference)": lambda: revert_delay_pattern_reference(delayed),
+        "revert (gather)": lambda: revert_delay_pattern(delayed),
+    }
+    for name, fn in timings.items():
+        print(f"{name:>22}: {time_per_call(fn, args.iters, device) * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Per-token rotary embedding + KV-cache write: the float32 `apply_rotary_emb` path against the precomputed
+cos/sin tables applied in the model dtype directly into the cache slot.
+
+Usage:
+    python -m benchmarks.rotary --device cuda --batch-size 2 --seqlen 1
+"""
+
+import argparse
+
+import torch
+
+from benchmarks._timing import time_per_call
+from zonos.backbone._torch import apply_rotary_emb, apply_rotary_emb_, precompute_freqs_cis, precompute_rope_tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--dtype", default="bfloat16")
+    parser.add_argument("--batch-size", type=int, default=2, help="Includes the CFG rows.")
+    parser.add_argument("--seqlen", type=int, default=1, help="1 for decode, larger for prefill.")
+    parser.add_argument("--num-heads", type=int, default=16)
+    parser.add_argument("--num-heads-kv", type=int, default=4)
+    parser.add_argument("--head-dim", type=int, default=128)
+    parser.add_argument("--position", type=int, default=1000)
+    parser.add_argument("--iters", type=int, default=2000)
+    args = parser.parse_args()
+
+    device, dtype = torch.device(args.device), getattr(torch, args.dtype)
+    bsz, seqlen = args.batch_size, args.seqlen
+    q = torch.randn(bsz, seqlen, args.num_heads, args.head_dim, device=device, dtype=dtype)
+    k = torch.randn(bsz, seqlen, args.num_heads_kv, args.head_dim, device=device, dtype=dtype)
+    v = torch.randn_like(k)
+    kv_cache = torch.zeros(bsz, args.position + seqlen, 2, args.num_heads_kv, args.head_dim, device=device, dtype=dtype)
+    slot = kv_cache[:, args.position : args.position + seqlen]
+
+    input_pos = torch.arange(seqlen, device=device) + torch.full((bsz, 1), args.position, device=device)
+    freqs_cis_table = precompute_freqs_cis(16384, args.head_dim).to(device)
+    cos_table, sin_table = precompute_rope_tables(16384, args.head_dim, dtype, device)
+
+    def reference():
+        freqs_cis = freqs_cis_table[input_pos].expand(bsz, -1, -1, -1)
+        q_rot = apply_rotary_emb(q, freqs_cis)
+        slot[:, :, 0] = apply_rotary_emb(k, freqs_cis)
+        slot[:, :, 1] = v
+        return q_rot
+
+    def precomputed():
+        cos = cos_table[input_pos].unsqueeze(-2)
+        sin = sin_table[input_pos].unsqueeze(-2)
+        q_rot = apply_rotary_emb_(q, cos, sin, out=torch.empty_like(q))
+        apply_rotary_emb_(k, cos, sin, out=slot[:, :, 0])
+        slot[:, :, 1].copy_(v)
+        return q_rot
+
+    q_ref, k_ref = reference(), slot[:, :, 0].clone()
+    q_new, k_new = precomputed(), slot[:, :, 0].clone()
+    q_err = (q_ref.float() - q_new.float()).abs().max().item()
+    k_err = (k_ref.float() - k_new.float()).abs().max().item()
+    print(f"max abs difference vs float32 path: q {q_err:.2e}, k {k_err:.2e} ({args.dtype})")
+
+    t_ref = time_per_call(reference, args.iters, device)
+    t_new = time_per_call(precomputed, args.iters, device)
+    print(f"float32 round-trip: {t_ref * 1e6:8.1f} us per layer per step")
+    print(f"precomputed tables: {t_new * 1e6:8.1f} us per layer per step ({t_ref / t_new:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+End-to-end real-time-factor benchmark on a small randomly initialized model, so it runs anywhere (CPU included)
+without downloading weights. Only espeak-ng is needed, as for normal use.
+
+For every (batch size, text length) case it times each stage of synthesis separately:
+
+    phonemize             text -> phonemes
+    prepare_conditioning  cond dict -> prefix embeddings (includes phonemization)
+    prefill               first forward pass over the prefix
+    decode_step           one eager `_decode_one_token` call (mean over --decode-iters)
+    sampling              one `sample_from_logits` call (mean over --decode-iters)
+    generate              the full `generate` loop
+    dac_decode            codes -> waveform
+
+and derives tokens/sec (frames per second across the batch), the real-time factor (generate + DAC decode time
+over seconds of audio produced, lower is better) and peak memory. Results are printed and optionally written
+as JSON for regression tracking.
+
+Random weights don't learn when to stop, so generations usually run to --max-new-tokens; the derived numbers
+use the frames actually produced.
+
+Usage:
+    python -m benchmarks.rtf --device cpu --batch-sizes 1 4 --sentences 1 4 --output rtf.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import torch
+from transformers import DacConfig, DacModel
+
+from benchmarks._timing import sync
+from zonos.autoencoder import DACAutoencoder
+from zonos.backbone import BACKBONES
+from zonos.conditioning import make_cond_dict, merge_cond_dicts, phonemize
+from zonos.config import ZonosConfig
+from zonos.model import Zonos
+from zonos.sampling import SamplingWorkspace, sample_from_logits
+
+SENTENCE = "The quick brown fox jumps over the lazy dog, and then it runs back into the forest."
+
+# Same conditioners as the released models, so conditioning cost is representative.
+CONDITIONERS = [
+    {"type": "EspeakPhonemeConditioner", "name": "espeak"},
+    {"type": "PassthroughConditioner", "name": "speaker", "cond_dim": 128, "projection": "linear", "uncond_type": "learned"},
+    {"type": "FourierConditioner", "name": "emotion", "input_dim": 8, "uncond_type": "learned"},
+    {"type": "FourierConditioner", "name": "fmax", "min_val": 0, "max_val": 24000, "uncond_type": "learned"},
+    {"type": "FourierConditioner", "name": "pitch_std", "min_val": 0, "max_val": 400, "uncond_type": "learned"},
+    {"type": "FourierConditioner", "name": "speaking_rate", "min_val": 0, "max_val": 40, "uncond_type": "learned"},
+    {"type": "IntegerConditioner", "name": "language_id", "min_val": -1, "max_val": 126},
+    {"type": "FourierConditioner", "name": "vqscore_8", "input_dim": 8, "min_val": 0.5, "max_val": 0.8, "uncond_type": "learned"},
+    {"type": "FourierConditioner", "name": "ctc_loss", "min_val": -1.0, "max_val": 1000, "uncond_type": "learned"},
+    {"type": "FourierConditioner", "name": "dnsmos_ovrl", "min_val": 1, "max_val": 5, "uncond_type": "learned"},
+    {"type": "IntegerConditioner", "name": "speaker_noised", "min_val": 0, "max_val": 1, "uncond_type": "learned"},
+]  # fmt: off
+
+
+def build_tiny_model(
+    device: torch.device, d_model: int = 256, n_layer: int = 4, num_heads: int = 4, num_heads_kv: int = 2
+) -> Zonos:
+    """A randomly initialized transformer `Zonos` with a small DAC; same shapes per token, far fewer weights."""
+    config = ZonosConfig.from_dict(
+        {
+            "backbone": {
+                "d_model": d_model,
+                "n_layer": n_layer,
+                "attn_mlp_d_intermediate": 2 * d_model,
+                "attn_cfg": {"num_heads": num_heads, "num_heads_kv": num_heads_kv},
+            },
+            "prefix_conditioner": {"conditioners": CONDITIONERS, "projection": "linear"},
+        }
+    )
+    dac_config = DacConfig(
+        encoder_hidden_size=8,
+        downsampling_ratios=[2, 4, 8, 8],  # 512 samples per frame at 44.1kHz, like the real codec
+        decoder_hidden_size=64,
+        hidden_size=128,
+        n_codebooks=9,
+        codebook_size=1024,
+        sampling_rate=44_100,
+    )
+    autoencoder = DACAutoencoder(DacModel(dac_config).eval().requires_grad_(False))
+    autoencoder.dac.to(device)
+
+    model = Zonos(config, BACKBONES["torch"], autoencoder).to(device, torch.bfloat16)
+    return model.requires_grad_(False).eval()
+
+
+def _timed(fn, device: torch.device):
+    sync(device)
+    start = time.perf_counter()
+    result = fn()
+    sync(device)
+    return result, time.perf_counter() - start
+
+
+def _reset_peak_memory(device: torch.device):
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+
+
+def _peak_memory_mb(device: torch.device) -> float | None:
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # Process-wide high-water mark, so it never goes down between cases. ru_maxrss is in KiB on Linux.
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+@torch.inference_mode()
+def bench_case(
+    model: Zonos, batch_size: int, num_sentences: int, max_new_tokens: int, decode_iters: int, seed: int
+) -> dict:
+    device = model.device
+    text = " ".join([SENTENCE] * num_sentences)
+    torch.manual_seed(seed)
+    _reset_peak_memory(device)
+    stages = {}
+
+    _, stages["phonemize"] = _timed(lambda: phonemize([text] * batch_size, ["en-us"] * batch_size), device)
+
+    cond_dict = merge_cond_dicts([make_cond_dict(text=text, device=device)] * batch_size)
+    conditioning, stages["prepare_conditioning"] = _timed(lambda: model.prepare_conditioning(cond_dict), device)
+
+    # Prefill and single decode steps, set up the way `generate` does.
+    cfg_scale = torch.tensor(2.0)
+    params = model.setup_cache(batch_size * 2, conditioning.shape[1] + decode_iters + 2)
+    input_ids = torch.full((batch_size, 9, 1), model.masked_token_id, device=device)
+    logits, stages["prefill"] = _timed(lambda: model._prefill(conditioning, input_ids, params, cfg_scale), device)
+    params.seqlen_offset += conditioning.shape[1] + 1
+    params.lengths_per_sample[:] += conditioning.shape[1] + 1
+
+    decode_time = sampling_time = 0.0
+    workspace = SamplingWorkspace.like(logits)
+    generated = torch.randint(0, 1024, (batch_size, 9, 64), device=device)
+    decode_one_token = model._decode_one_token
+    for _ in range(decode_iters):
+        logits, t = _timed(lambda: decode_one_token(input_ids, params, cfg_scale, allow_cudagraphs=False), device)
+        decode_time += t
+        params.seqlen_offset += 1
+        params.lengths_per_sample[:] += 1
+        input_ids, t = _timed(
+            lambda: sample_from_logits(logits, generated_tokens=generated, workspace=workspace, min_p=0.1), device
+        )
+        sampling_time += t
+    model.release_cache(params)
+    stages["decode_step"] = decode_time / decode_iters
+    stages["sampling"] = sampling_time / decode_iters
+
+    (codes, lengths), stages["generate"] = _timed(
+        lambda: model.generate(
+            conditioning,
+            max_new_tokens=max_new_tokens,
+            batch_size=batch_size,
+            progress_bar=False,
+            disable_torch_compile=True,
+            return_lengths=True,
+        ),
+        device,
+    )
+    _, stages["dac_decode"] = _timed(lambda: model.autoencoder.decode(codes), device)
+
+    frames = int(lengths.sum())
+    audio_seconds = frames * 512 / model.autoencoder.sampling_rate
+    return {
+        "batch_size": batch_size,
+        "num_sentences": num_sentences,
+        "text_chars": len(text),
+        "frames": frames,
+        "audio_seconds": audio_seconds,
+        "stages_s": stages,
+        "tokens_per_s": frames / stages["generate"],
+        "rtf": (stages["generate"] + stages["dac_decode"]) / max(audio_seconds, 1e-9),
+        "peak_memory_mb": _peak_memory_mb(device),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--sentences", type=int, nargs="+", default=[1, 4], help="Text lengths, in sentences.")
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    parser.add_argument("--decode-iters", type=int, default=32)
+    parser.add_argument("--d-model", type=int, default=256)
+    parser.add_argument("--n-layer", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    torch.manual_seed(args.seed)
+    model = build_tiny_model(device, d_model=args.d_model, n_layer=args.n_layer)
+    bench_case(model, 1, 1, 16, 4, args.seed)  # warm up espeak, allocator and kernels
+
+    results = []
+    for batch_size in args.batch_sizes:
+        for num_sentences in args.sentences:
+            r = bench_case(model, batch_size, num_sentences, args.max_new_tokens, args.decode_iters, args.seed)
+            results.append(r)
+            stages = "  ".join(f"{name} {t * 1e3:.1f}ms" for name, t in r["stages_s"].items())
+            print(
+                f"bsz={batch_size} sentences={num_sentences}: rtf {r['rtf']:.3f}  {r['tokens_per_s']:.1f} tok/s"
+                f"  peak {r['peak_memory_mb'] or float('nan'):.0f}MB\n  {stages}"
+            )
+
+    if args.output:
+        report = {
+            "device": str(device),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "model": {"d_model": args.d_model, "n_layer": args.n_layer},
+            "max_new_tokens": args.max_new_tokens,
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import asyncio
+
 import torch
 import torchaudio
 import soundfile as sf
@@ -5,29 +7,20 @@ import numpy as np
 import gradio as gr
 from os import getenv
 
-from zonos.model import Zonos, DEFAULT_BACKBONE_CLS as ZonosBackbone
+from zonos.model import DEFAULT_BACKBONE_CLS as ZonosBackbone
+from zonos.async_generate import generate_async
 from zonos.conditioning import make_cond_dict, supported_language_codes
+from zonos.registry import ModelRegistry
 from zonos.utils import DEFAULT_DEVICE as device
 
-CURRENT_MODEL_TYPE = None
-CURRENT_MODEL = None
+MODEL_REGISTRY = ModelRegistry.from_env(device)
 
 SPEAKER_EMBEDDING = None
 SPEAKER_AUDIO_PATH = None
 
 
 def load_model_if_needed(model_choice: str):
-    global CURRENT_MODEL_TYPE, CURRENT_MODEL
-    if CURRENT_MODEL_TYPE != model_choice:
-        if CURRENT_MODEL is not None:
-            del CURRENT_MODEL
-            torch.cuda.empty_cache()
-        print(f"Loading {model_choice} model...")
-        CURRENT_MODEL = Zonos.from_pretrained(model_choice, device=device)
-        CURRENT_MODEL.requires_grad_(False).eval()
-        CURRENT_MODEL_TYPE = model_choice
-        print(f"{model_choice} model loaded successfully!")
-    return CURRENT_MODEL
+    return MODEL_REGISTRY.get(model_choice)
 
 
 def update_ui(model_choice):
@@ -84,7 +77,7 @@ def update_ui(model_choice):
     )
 
 
-def generate_audio(
+async def generate_audio(
     model_choice,
     text,
     language,
@@ -120,100 +113,108 @@ def generate_audio(
     Generates audio based on the provided UI parameters.
     We do NOT use language_id or ctc_loss even if the model has them.
     """
-    selected_model = load_model_if_needed(model_choice)
-
-    speaker_noised_bool = bool(speaker_noised)
-    fmax = float(fmax)
-    pitch_std = float(pitch_std)
-    speaking_rate = float(speaking_rate)
-    dnsmos_ovrl = float(dnsmos_ovrl)
-    cfg_scale = float(cfg_scale)
-    top_p = float(top_p)
-    top_k = int(top_k)
-    min_p = float(min_p)
-    linear = float(linear)
-    confidence = float(confidence)
-    quadratic = float(quadratic)
-    seed = int(seed)
-    max_new_tokens = 86 * 30
-
-    # This is a bit ew, but works for now.
-    global SPEAKER_AUDIO_PATH, SPEAKER_EMBEDDING
-
-    if randomize_seed:
-        seed = torch.randint(0, 2**32 - 1, (1,)).item()
-    torch.manual_seed(seed)
-
-    if speaker_audio is not None and "speaker" not in unconditional_keys:
-        if speaker_audio != SPEAKER_AUDIO_PATH:
-            print("Recomputed speaker embedding")
-            wav_data, sr = sf.read(speaker_audio)
-            wav = torch.from_numpy(wav_data).float()
-            if wav.dim() == 1:
-                wav = wav.unsqueeze(0)  # Add channel dimension
-            elif wav.dim() == 2:
-                wav = wav.T  # soundfile uses (frames, channels), we need (channels, frames)
-            SPEAKER_EMBEDDING = selected_model.make_speaker_embedding(wav, sr)
-            SPEAKER_EMBEDDING = SPEAKER_EMBEDDING.to(device, dtype=torch.bfloat16)
-            SPEAKER_AUDIO_PATH = speaker_audio
-
-    audio_prefix_codes = None
-    if prefix_audio is not None:
-        wav_prefix_data, sr_prefix = sf.read(prefix_audio)
-        wav_prefix = torch.from_numpy(wav_prefix_data).float()
-        if wav_prefix.dim() == 1:
-            wav_prefix = wav_prefix.unsqueeze(0)  # Add channel dimension
-        elif wav_prefix.dim() == 2:
-            wav_prefix = wav_prefix.T  # soundfile uses (frames, channels), we need (channels, frames)
-        wav_prefix = wav_prefix.mean(0, keepdim=True)
-        wav_prefix = selected_model.autoencoder.preprocess(wav_prefix, sr_prefix)
-        wav_prefix = wav_prefix.to(device, dtype=torch.float32)
-        audio_prefix_codes = selected_model.autoencoder.encode(wav_prefix.unsqueeze(0))
-
-    emotion_tensor = torch.tensor(list(map(float, [e1, e2, e3, e4, e5, e6, e7, e8])), device=device)
-
-    vq_val = float(vq_single)
-    vq_tensor = torch.tensor([vq_val] * 8, device=device).unsqueeze(0)
-
-    cond_dict = make_cond_dict(
-        text=text,
-        language=language,
-        speaker=SPEAKER_EMBEDDING,
-        emotion=emotion_tensor,
-        vqscore_8=vq_tensor,
-        fmax=fmax,
-        pitch_std=pitch_std,
-        speaking_rate=speaking_rate,
-        dnsmos_ovrl=dnsmos_ovrl,
-        speaker_noised=speaker_noised_bool,
-        device=device,
-        unconditional_keys=unconditional_keys,
-    )
-    conditioning = selected_model.prepare_conditioning(cond_dict)
-
-    estimated_generation_duration = 30 * len(text) / 400
-    estimated_total_steps = int(estimated_generation_duration * 86)
-
-    def update_progress(_frame: torch.Tensor, step: int, _total_steps: int) -> bool:
-        progress((step, estimated_total_steps))
-        return True
-
-    codes = selected_model.generate(
-        prefix_conditioning=conditioning,
-        audio_prefix_codes=audio_prefix_codes,
-        max_new_tokens=max_new_tokens,
-        cfg_scale=cfg_scale,
-        batch_size=1,
-        sampling_params=dict(top_p=top_p, top_k=top_k, min_p=min_p, linear=linear, conf=confidence, quad=quadratic),
-        callback=update_progress,
-        disable_torch_compile=True if "transformer" in model_choice else False,
-    )
+    # Everything that runs the model goes to a worker thread, so other sessions' events keep being served.
+    loop = asyncio.get_running_loop()
+    # The lease keeps another session's model switch from offloading this model while it generates.
+    selected_model = await loop.run_in_executor(None, MODEL_REGISTRY.acquire, model_choice)
+    try:
+        speaker_noised_bool = bool(speaker_noised)
+        fmax = float(fmax)
+        pitch_std = float(pitch_std)
+        speaking_rate = float(speaking_rate)
+        dnsmos_ovrl = float(dnsmos_ovrl)
+        cfg_scale = float(cfg_scale)
+        top_p = float(top_p)
+        top_k = int(top_k)
+        min_p = float(min_p)
+        linear = float(linear)
+        confidence = float(confidence)
+        quadratic = float(quadratic)
+        seed = int(seed)
+        max_new_tokens = 86 * 30
+
+        # This is a bit ew, but works for now.
+        global SPEAKER_AUDIO_PATH, SPEAKER_EMBEDDING
+
+        if randomize_seed:
+            seed = torch.randint(0, 2**32 - 1, (1,)).item()
+        generator = torch.Generator(device=device).manual_seed(seed)
+
+        if speaker_audio is not None and "speaker" not in unconditional_keys:
+            if speaker_audio != SPEAKER_AUDIO_PATH:
+                print("Recomputed speaker embedding")
+                wav_data, sr = sf.read(speaker_audio)
+                wav = torch.from_numpy(wav_data).float()
+                if wav.dim() == 1:
+                    wav = wav.unsqueeze(0)  # Add channel dimension
+                elif wav.dim() == 2:
+                    wav = wav.T  # soundfile uses (frames, channels), we need (channels, frames)
+                SPEAKER_EMBEDDING = await loop.run_in_executor(None, selected_model.make_speaker_embedding, wav, sr)
+                SPEAKER_EMBEDDING = SPEAKER_EMBEDDING.to(device, dtype=torch.bfloat16)
+                SPEAKER_AUDIO_PATH = speaker_audio
+
+        audio_prefix_codes = None
+        if prefix_audio is not None:
+            wav_prefix_data, sr_prefix = sf.read(prefix_audio)
+            wav_prefix = torch.from_numpy(wav_prefix_data).float()
+            if wav_prefix.dim() == 1:
+                wav_prefix = wav_prefix.unsqueeze(0)  # Add channel dimension
+            elif wav_prefix.dim() == 2:
+                wav_prefix = wav_prefix.T  # soundfile uses (frames, channels), we need (channels, frames)
+            wav_prefix = wav_prefix.mean(0, keepdim=True)
+            wav_prefix = selected_model.autoencoder.preprocess(wav_prefix, sr_prefix)
+            wav_prefix = wav_prefix.to(device, dtype=torch.float32).unsqueeze(0)
+            audio_prefix_codes = await loop.run_in_executor(None, selected_model.autoencoder.encode, wav_prefix)
+
+        emotion_tensor = torch.tensor(list(map(float, [e1, e2, e3, e4, e5, e6, e7, e8])), device=device)
+
+        vq_val = float(vq_single)
+        vq_tensor = torch.tensor([vq_val] * 8, device=device).unsqueeze(0)
+
+        cond_dict = make_cond_dict(
+            text=text,
+            language=language,
+            speaker=SPEAKER_EMBEDDING,
+            emotion=emotion_tensor,
+            vqscore_8=vq_tensor,
+            fmax=fmax,
+            pitch_std=pitch_std,
+            speaking_rate=speaking_rate,
+            dnsmos_ovrl=dnsmos_ovrl,
+            speaker_noised=speaker_noised_bool,
+            device=device,
+            unconditional_keys=unconditional_keys,
+        )
+        conditioning = await loop.run_in_executor(None, selected_model.prepare_conditioning, cond_dict)
+
+        estimated_generation_duration = 30 * len(text) / 400
+        estimated_total_steps = int(estimated_generation_duration * 86)
+
+        def update_progress(step: int, _total_steps: int):
+            progress((step, estimated_total_steps))
+
+        # Decoding runs off the event loop; Stop or a closed tab cancels this task, which stops it at the next step.
+        codes = await generate_async(
+            selected_model,
+            prefix_conditioning=conditioning,
+            audio_prefix_codes=audio_prefix_codes,
+            max_new_tokens=max_new_tokens,
+            cfg_scale=cfg_scale,
+            batch_size=1,
+            sampling_params=dict(top_p=top_p, top_k=top_k, min_p=min_p, linear=linear, conf=confidence, quad=quadratic),
+            on_progress=update_progress,
+            generator=generator,
+            disable_torch_compile=True if "transformer" in model_choice else False,
+        )
 
-    wav_out = selected_model.autoencoder.decode(codes).cpu().detach()
-    sr_out = selected_model.autoencoder.sampling_rate
-    if wav_out.dim() == 2 and wav_out.size(0) > 1:
-        wav_out = wav_out[0:1, :]
-    return (sr_out, wav_out.squeeze().numpy()), seed
+        wav_out = (await loop.run_in_executor(None, selected_model.autoencoder.decode, codes)).cpu().detach()
+        sr_out = selected_model.autoencoder.sampling_rate
+        if wav_out.dim() == 2 and wav_out.size(0) > 1:
+            wav_out = wav_out[0:1, :]
+        return (sr_out, wav_out.squeeze().numpy()), seed
+    finally:
+        # Not awaited: releasing may offload another model, and a cancelled task shouldn't wait for that.
+        loop.run_in_executor(None, MODEL_REGISTRY.release, model_choice)
 
 
 def build_interface():
@@ -331,6 +332,7 @@ def build_interface():
 
         with gr.Column():
             generate_button = gr.Button("Generate Audio")
+            stop_button = gr.Button("Stop")
             output_audio = gr.Audio(label="Generated Audio", type="numpy", autoplay=True)
 
         model_choice.change(
@@ -387,7 +389,7 @@ def build_interface():
         )
 
         # Generate audio on button click
-        generate_button.click(
+        generate_event = generate_button.click(
             fn=generate_audio,
             inputs=[
                 model_choice,
@@ -422,6 +424,7 @@ def build_interface():
             ],
             outputs=[output_audio, seed_number],
         )
+        stop_button.click(fn=None, cancels=[generate_event])
 
     return demo
 
@@ -3,10 +3,17 @@ Narration Studio - Batch TTS with Multi-Voice Support
 A Gradio application for narrating scripts with Zonos voice cloning.
 """
 
+import hashlib
+import json
 import os
 import re
+import shutil
 import subprocess
 import tempfile
+import time
+import uuid
+from collections import deque
+from contextlib import nullcontext
 from dataclasses import dataclass, field
 from typing import Literal
 
@@ -17,31 +24,45 @@ import torch
 import torchaudio
 
 from zonos.conditioning import make_cond_dict, supported_language_codes
+from zonos.generation_cache import CacheEntry, GenerationCache, request_key
 from zonos.model import DEFAULT_BACKBONE_CLS as ZonosBackbone
-from zonos.model import Zonos
+from zonos.pipeline import SynthesisPipeline, SynthesisRequest
+from zonos.registry import ModelRegistry
+from zonos.sampling import make_generators
+from zonos.worker_pool import CPUWorkerPool
 from zonos.utils import DEFAULT_DEVICE as device
 
 # =============================================================================
 # Global State (Model Caching)
 # =============================================================================
 
-CURRENT_MODEL_TYPE = None
-CURRENT_MODEL = None
+MODEL_REGISTRY = ModelRegistry.from_env(device)
 
 
-def load_model_if_needed(model_choice: str):
-    """Load model if not already loaded or if different model requested."""
-    global CURRENT_MODEL_TYPE, CURRENT_MODEL
-    if CURRENT_MODEL_TYPE != model_choice:
-        if CURRENT_MODEL is not None:
-            del CURRENT_MODEL
-            torch.cuda.empty_cache()
-        print(f"Loading {model_choice} model...")
-        CURRENT_MODEL = Zonos.from_pretrained(model_choice, device=device)
-        CURRENT_MODEL.requires_grad_(False).eval()
-        CURRENT_MODEL_TYPE = model_choice
-        print(f"{model_choice} model loaded successfully!")
-    return CURRENT_MODEL
+# Worker processes take a while to spawn, so one pool serves every Generate All until the model changes.
+_CPU_POOL = None
+
+
+def cpu_worker_pool(model, num_workers: int) -> CPUWorkerPool:
+    global _CPU_POOL
+    pool = _CPU_POOL
+    if pool is not None and pool.model is model and pool.num_workers == num_workers and pool.broken is None:
+        return pool
+    if pool is not None:
+        pool.close()
+    _CPU_POOL = CPUWorkerPool(model, num_workers=num_workers)
+    return _CPU_POOL
+
+
+# Sessions are saved under here unless another project directory is chosen in the UI.
+PROJECTS_DIR = os.path.join(os.path.dirname(__file__), "narration_projects")
+SESSION_MANIFEST = "session.json"
+
+# Finished sentences, keyed by everything that determines them, shared by all projects. ZONOS_CACHE_GB caps its size.
+GENERATION_CACHE = GenerationCache(
+    os.path.join(os.path.dirname(__file__), "narration_cache"),
+    max_bytes=int(float(os.getenv("ZONOS_CACHE_GB", "2")) * 2**30),
+)
 
 
 # =============================================================================
@@ -55,6 +76,7 @@ class VoiceProfile:
     name: str
     audio_path: str
     embedding: torch.Tensor = None
+    embedding_path: str = None  # cached embedding, for sessions saved to a project directory
 
 
 @dataclass
@@ -63,17 +85,52 @@ class SentenceItem:
     index: int
     text: str
     voice_name: str = None
-    audio_data: np.ndarray = None
+    codes_path: str = None
     sample_rate: int = 44100
     status: Literal["pending", "generating", "done", "error"] = "pending"
+    take: int = 0  # bumped by every regeneration, to draw a new seed
+    _codes: np.ndarray = field(default=None, repr=False)
+
+    @property
+    def has_audio(self) -> bool:
+        return self._codes is not None or self.codes_path is not None
+
+    @property
+    def codes(self) -> np.ndarray | None:
+        """The sentence's DAC codes, [num_codebooks, frames]; memory-mapped from the project directory."""
+        if self._codes is None and self.codes_path is not None:
+            return np.load(self.codes_path, mmap_mode="r")
+        return self._codes
+
+    @property
+    def audio_data(self) -> np.ndarray | None:
+        """The sentence's audio, decoded from its codes on demand."""
+        return decode_sentences([self])[0] if self.has_audio else None
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        # Windows refuses while the file is still memory-mapped; it's swept up when the project is next opened.
+        pass
 
 
 @dataclass
 class NarrationSession:
-    """Main session state containing all narration data."""
+    """
+    Main session state containing all narration data.
+
+    Sentences keep the DAC codes they were generated as, over 100x smaller than the audio, and decode them
+    when they're played or exported. With a `project_dir` the session lives on disk: every sentence's codes
+    are their own .npy file under `codes/`, voice samples and their embeddings are kept under `voices/`, and
+    `session.json` lists them, so a restart picks up where it left off without regenerating anything.
+    """
     sentences: list = field(default_factory=list)
     voices: dict = field(default_factory=dict)
     default_voice: str = None
+    project_dir: str = None
+    render_dir: str = None  # scratch SegmentStore of a session without a project
 
     def to_dataframe(self):
         """Convert sentences to DataFrame format for Gradio."""
@@ -88,6 +145,127 @@ class NarrationSession:
         """Get list of available voice names."""
         return list(self.voices.keys())
 
+    @classmethod
+    def open(cls, project_dir: str) -> "NarrationSession":
+        """Load the session saved in `project_dir`, or start an empty one there."""
+        session = cls(project_dir=project_dir)
+        manifest_path = os.path.join(project_dir, SESSION_MANIFEST)
+        if not os.path.exists(manifest_path):
+            session.save()
+            return session
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        def path(rel):
+            return os.path.join(project_dir, rel) if rel else None
+
+        for v in manifest["voices"]:
+            embedding_path = path(v["embedding_path"])
+            if embedding_path is None or not os.path.exists(embedding_path):
+                print(f"Skipping voice {v['name']!r}: its embedding is missing, add the voice again")
+                continue
+            session.voices[v["name"]] = VoiceProfile(
+                name=v["name"],
+                audio_path=path(v["audio_path"]),
+                embedding=torch.load(embedding_path).to(device),
+                embedding_path=embedding_path,
+            )
+        if manifest["default_voice"] in session.voices:
+            session.default_voice = manifest["default_voice"]
+
+        for s in manifest["sentences"]:
+            sentence = SentenceItem(
+                index=s["index"],
+                text=s["text"],
+                voice_name=s["voice_name"],
+                codes_path=path(s["codes_path"]),
+                sample_rate=s["sample_rate"],
+                status=s["status"],
+                take=s.get("take", 0),
+            )
+            if sentence.codes_path is not None and not os.path.exists(sentence.codes_path):
+                sentence.codes_path = None
+            # Interrupted mid-generation, or the codes went missing.
+            if sentence.status == "generating" or (sentence.status == "done" and not sentence.has_audio):
+                sentence.status = "pending"
+            session.sentences.append(sentence)
+
+        # Takes that were replaced, or written just before a crash, but never made it into the manifest.
+        referenced = {s.codes_path for s in session.sentences}
+        codes_dir = os.path.join(project_dir, "codes")
+        for name in os.listdir(codes_dir) if os.path.isdir(codes_dir) else []:
+            if os.path.join(codes_dir, name) not in referenced:
+                _remove_quietly(os.path.join(codes_dir, name))
+        return session
+
+    def save(self):
+        """Write the manifest. Codes and embeddings are written as they're produced; no-op without a project."""
+        if self.project_dir is None:
+            return
+        os.makedirs(os.path.join(self.project_dir, "codes"), exist_ok=True)
+        os.makedirs(os.path.join(self.project_dir, "voices"), exist_ok=True)
+
+        def rel(path):
+            return os.path.relpath(path, self.project_dir) if path else None
+
+        manifest = {
+            "default_voice": self.default_voice,
+            "voices": [
+                {"name": v.name, "audio_path": rel(v.audio_path), "embedding_path": rel(v.embedding_path)}
+                for v in self.voices.values()
+            ],
+            "sentences": [
+                {
+                    "index": s.index,
+                    "text": s.text,
+                    "voice_name": s.voice_name,
+                    "codes_path": rel(s.codes_path),
+                    "sample_rate": s.sample_rate,
+                    "status": s.status,
+                    "take": s.take,
+                }
+                for s in self.sentences
+            ],
+        }
+        manifest_path = os.path.join(self.project_dir, SESSION_MANIFEST)
+        with open(manifest_path + ".partial", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(manifest_path + ".partial", manifest_path)
+
+    def add_voice(self, name: str, audio_path: str, embedding: torch.Tensor):
+        voice = VoiceProfile(name=name, audio_path=audio_path, embedding=embedding)
+        if self.project_dir is not None:
+            # Gradio's upload is a temporary file, so the project keeps its own copy of the sample.
+            stem = os.path.join(self.project_dir, "voices", re.sub(r"[^\w-]", "_", name))
+            voice.audio_path = stem + os.path.splitext(audio_path)[1]
+            shutil.copyfile(audio_path, voice.audio_path)
+            voice.embedding_path = stem + ".pt"
+            torch.save(embedding.cpu(), voice.embedding_path)
+        self.voices[name] = voice
+
+    def set_sentences(self, texts: list):
+        for sentence in self.sentences:
+            if sentence.codes_path is not None:
+                _remove_quietly(sentence.codes_path)
+        self.sentences = [SentenceItem(index=i, text=s) for i, s in enumerate(texts)]
+
+    def set_codes(self, sentence: SentenceItem, codes: np.ndarray, sample_rate: int):
+        """Store a finished take for `sentence`; in a project it goes to disk instead of staying in memory."""
+        sentence.sample_rate = sample_rate
+        codes = np.asarray(codes, dtype=np.int16)
+        if self.project_dir is None:
+            sentence._codes = codes
+            return
+        # A new file per take, since the previous one may still be memory-mapped.
+        old_path = sentence.codes_path
+        filename = f"{sentence.index:05d}-{uuid.uuid4().hex[:8]}.npy"
+        sentence.codes_path = os.path.join(self.project_dir, "codes", filename)
+        np.save(sentence.codes_path, codes)
+        sentence._codes = None
+        if old_path is not None:
+            _remove_quietly(old_path)
+
 
 def create_empty_session():
     """Create a new empty session dictionary."""
@@ -175,8 +353,21 @@ def generate_single_sentence(
     speaking_rate: float,
     pitch_std: float,
     progress_callback=None,
+    seed: int = None,
+    model_id: str = None,
+    cache: GenerationCache = None,
 ) -> tuple:
-    """Generate audio for a single sentence."""
+    """
+    Generate DAC codes ([num_codebooks, frames] int16) for a single sentence; `decode_sentences` turns them into
+    audio. Seeded generations are looked up in and added to `cache`.
+    """
+    key = None
+    if cache is not None and seed is not None:
+        request = make_sentence_request(text, speaker_embedding, language, cfg_scale, speaking_rate, pitch_std, seed)
+        key = request_key(model_id, request)
+        if (entry := cache.get(key)) is not None:
+            return entry.sampling_rate, entry.codes
+
     cond_dict = make_cond_dict(
         text=text,
         language=language,
@@ -196,83 +387,259 @@ def generate_single_sentence(
         batch_size=1,
         callback=progress_callback,
         disable_torch_compile=True,
+        generator=make_generators([seed], device) if seed is not None else None,
     )
 
-    wav_out = model.autoencoder.decode(codes).cpu().detach()
+    codes_out = codes[0].cpu().numpy().astype(np.int16)
     sr_out = model.autoencoder.sampling_rate
 
-    if wav_out.dim() == 2 and wav_out.size(0) > 1:
-        wav_out = wav_out[0:1, :]
+    if key is not None:
+        cache.put(key, CacheEntry(codes_out, sr_out))
+    return sr_out, codes_out
+
+
+def sentence_seed(seed: int, take: int, variant: int = 0) -> int:
+    """Seed for one take of a sentence. Generators only use a seed's low 32 bits, so `variant` is mixed into those."""
+    return (int(seed) + take + variant * 0x9E3779B9) % 2**32
+
+
+def make_sentence_request(
+    text: str,
+    speaker_embedding: torch.Tensor,
+    language: str,
+    cfg_scale: float,
+    speaking_rate: float,
+    pitch_std: float,
+    seed: int = None,
+) -> SynthesisRequest:
+    """Pipeline request equivalent to `generate_single_sentence`."""
+    return SynthesisRequest(
+        text=text,
+        language=language,
+        speaker=speaker_embedding,
+        cond_kwargs=dict(speaking_rate=speaking_rate, pitch_std=pitch_std),
+        generate_kwargs=dict(max_new_tokens=86 * 30, cfg_scale=cfg_scale, batch_size=1, disable_torch_compile=True),
+        seed=seed,
+        decode=False,
+    )
 
-    return sr_out, wav_out.squeeze().numpy()
+
+def decode_sentences(sentences: list, batch_size: int = 8) -> list:
+    """Decode the codes of `sentences` to float32 audio, batching sentences of similar length."""
+    autoencoder = MODEL_REGISTRY.autoencoder
+    codes = [torch.from_numpy(np.asarray(s.codes, dtype=np.int64)) for s in sentences]
+    order = sorted(range(len(codes)), key=lambda i: codes[i].shape[-1])
+    wavs = [None] * len(codes)
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            batch = order[start : start + batch_size]
+            for i, wav in zip(batch, autoencoder.decode_batch([codes[i] for i in batch])):
+                wavs[i] = wav.cpu().numpy()
+    return wavs
 
 
 # =============================================================================
 # Audio Merging and Export
 # =============================================================================
 
+SAMPLE_RATE = 44100
+SILENCE_CHUNK = SAMPLE_RATE  # audio is read and silence written at most a second at a time
+# LAME's encoder delay: each independently encoded MP3 chunk starts with this much extra silence, and is padded
+# at the end to a whole number of frames.
+MP3_ENCODER_DELAY = 1105
+MP3_FRAME_SAMPLES = 1152
+# The shortest gap `SegmentStore.mp3_path` can hold to length: the delay plus a frame of room to trim (51 ms).
+MP3_MIN_GAP = MP3_ENCODER_DELAY + MP3_FRAME_SAMPLES
+_MP3_BITRATES = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]  # kbit/s, MPEG-1 Layer III
+_MP3_SAMPLE_RATES = [44100, 48000, 32000]
+
+
+def mp3_num_samples(data: bytes) -> int:
+    """Samples a decoder outputs for a headerless MPEG-1 Layer III stream (no ID3 or Xing tag), by counting frames."""
+    offset = frames = 0
+    while offset + 4 <= len(data):
+        header = int.from_bytes(data[offset : offset + 4], "big")
+        if header >> 21 != 0x7FF:
+            raise ValueError(f"No MP3 frame header at byte {offset}")
+        bitrate = _MP3_BITRATES[(header >> 12) & 0xF] * 1000
+        sample_rate = _MP3_SAMPLE_RATES[(header >> 10) & 0x3]
+        offset += 144 * bitrate // sample_rate + ((header >> 9) & 1)
+        frames += 1
+    return frames * MP3_FRAME_SAMPLES
+
+
+class SegmentStore:
+    """
+    Rendered pieces of a narration, kept between exports: every sentence's audio as 16-bit PCM and, for MP3,
+    every sentence encoded together with the gap that follows it. Pieces are named after a hash of the
+    sentence's codes, so after regenerating one sentence an export decodes and encodes just that one and
+    splices the rest from disk.
+    """
 
-def merge_audio_segments(session: NarrationSession, silence_gap_ms: int = 500) -> tuple:
-    """Merge all generated audio segments with silence gaps."""
-    sample_rate = 44100
-    silence_samples = int(silence_gap_ms * sample_rate / 1000)
-    silence = np.zeros(silence_samples, dtype=np.float32)
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.rendered = 0  # pieces decoded or encoded, as opposed to reused
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _key(sentence: SentenceItem) -> str:
+        return hashlib.sha1(np.ascontiguousarray(sentence.codes).tobytes()).hexdigest()[:20]
+
+    def _write(self, path: str, write):
+        # Write under a temporary name, so an interrupted render never looks finished.
+        with open(path + ".partial", "wb") as f:
+            write(f)
+        os.replace(path + ".partial", path)
+        self.rendered += 1
+
+    def pcm_path(self, sentence: SentenceItem) -> str:
+        path = os.path.join(self.directory, f"{self._key(sentence)}.pcm")
+        if not os.path.exists(path):
+            codes = torch.from_numpy(np.asarray(sentence.codes, dtype=np.int64))
+
+            def write(f):
+                with torch.inference_mode():
+                    for wav in MODEL_REGISTRY.autoencoder.decode_stream(codes):
+                        f.write((wav.float().clamp(-1, 1) * 32767).to(torch.int16).cpu().numpy().tobytes())
+
+            self._write(path, write)
+        return path
+
+    def pcm(self, sentence: SentenceItem) -> np.ndarray:
+        return np.memmap(self.pcm_path(sentence), dtype=np.int16, mode="r")
+
+    @staticmethod
+    def _encode_mp3(pcm: np.ndarray) -> bytes:
+        return subprocess.run(
+            [
+                "ffmpeg", "-loglevel", "error",
+                "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1",
+                "-i", "pipe:0",
+                "-acodec", "libmp3lame",
+                "-b:a", "192k",
+                # No per-chunk headers, so the chunks concatenate into one valid stream
+                "-write_xing", "0", "-id3v2_version", "0",
+                "-f", "mp3", "pipe:1",
+            ],
+            input=pcm.tobytes(),
+            capture_output=True,
+            check=True,
+        ).stdout
+
+    def mp3_path(self, sentence: SentenceItem, gap_samples: int) -> str:
+        """
+        `sentence` followed by `gap_samples` of silence, as a headerless MP3 chunk. Unless it is the last chunk,
+        `gap_samples` should be at least `MP3_MIN_GAP`; shorter gaps come out up to a frame long.
+        """
+        path = os.path.join(self.directory, f"{self._key(sentence)}-{gap_samples}.mp3")
+        if not os.path.exists(path):
+            # Without a Xing tag players don't trim a chunk's encoder delay or end padding, so every chunk plays
+            # as a whole number of frames. Chunks meet in the middle of a gap, where that extra silence can't be
+            # heard: take it out of the gap, as measured from the encoded chunk. Each chunk then plays within
+            # half a frame (13 ms) of its length, early as often as late, instead of always running long.
+            speech = self.pcm(sentence)
+            target = len(speech) + gap_samples
+            gap = max(gap_samples - MP3_ENCODER_DELAY, 0)
+            data = self._encode_mp3(np.concatenate([speech, np.zeros(gap, dtype=np.int16)]))
+            # Every frame's worth of input dropped drops exactly one frame of output.
+            excess_frames = min(round((mp3_num_samples(data) - target) / MP3_FRAME_SAMPLES), gap // MP3_FRAME_SAMPLES)
+            if excess_frames > 0:
+                gap -= excess_frames * MP3_FRAME_SAMPLES
+                data = self._encode_mp3(np.concatenate([speech, np.zeros(gap, dtype=np.int16)]))
+            self._write(path, lambda f: f.write(data))
+        return path
+
+    def prune(self, keep: set):
+        """Delete pieces not in `keep`, i.e. from replaced takes or other export settings."""
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path not in keep and not name.endswith(".partial"):  # a render still being written
+                _remove_quietly(path)
+
+
+def segment_store(session: NarrationSession) -> SegmentStore:
+    """The session's own store, so pruning it never deletes another session's pieces."""
+    if session.project_dir is not None:
+        return SegmentStore(os.path.join(session.project_dir, "render"))
+    if session.render_dir is None:
+        session.render_dir = tempfile.mkdtemp(prefix="zonos-narration-")
+    return SegmentStore(session.render_dir)
+
+
+def _done_sentences(session: NarrationSession) -> list:
+    return [s for s in session.sentences if s.has_audio and s.status == "done"]
+
+
+def iter_narration_audio(session: NarrationSession, silence_gap_ms: int = 500, store: SegmentStore = None):
+    """
+    Yield the narration as consecutive float32 pieces of at most a second: every finished sentence, with
+    silence gaps in between. Only one piece is in memory at a time, however long the narration.
+    """
+    store = store or segment_store(session)
+    silence_samples = int(silence_gap_ms * SAMPLE_RATE / 1000)
+    for i, sentence in enumerate(_done_sentences(session)):
+        if i > 0:
+            for start in range(0, silence_samples, SILENCE_CHUNK):
+                yield np.zeros(min(SILENCE_CHUNK, silence_samples - start), dtype=np.float32)
+        pcm = store.pcm(sentence)
+        for start in range(0, len(pcm), SILENCE_CHUNK):
+            yield pcm[start : start + SILENCE_CHUNK].astype(np.float32) / 32767
 
-    segments = []
-    for sentence in session.sentences:
-        if sentence.audio_data is not None and sentence.status == "done":
-            segments.append(sentence.audio_data)
-            segments.append(silence)
 
-    if not segments:
-        return sample_rate, np.zeros(0, dtype=np.float32)
+def narration_num_samples(session: NarrationSession, silence_gap_ms: int = 500) -> int:
+    """Length of the merged narration, from the sentences' codes alone."""
+    hop_length = MODEL_REGISTRY.autoencoder.dac.config.hop_length
+    lengths = [s.codes.shape[-1] * hop_length for s in _done_sentences(session)]
+    return sum(lengths) + max(len(lengths) - 1, 0) * int(silence_gap_ms * SAMPLE_RATE / 1000)
 
-    # Remove trailing silence
-    if len(segments) > 1:
-        segments = segments[:-1]
 
-    merged = np.concatenate(segments)
-    return sample_rate, merged
+def merge_audio_segments(session: NarrationSession, silence_gap_ms: int = 500) -> tuple:
+    """Merge all generated audio segments with silence gaps."""
+    merged = np.zeros(narration_num_samples(session, silence_gap_ms), dtype=np.float32)
+    offset = 0
+    for piece in iter_narration_audio(session, silence_gap_ms):
+        merged[offset : offset + len(piece)] = piece
+        offset += len(piece)
+    return SAMPLE_RATE, merged
 
 
-def export_audio(audio_data: np.ndarray, sample_rate: int, output_format: str) -> str:
-    """Export audio to file. Returns the file path."""
+def export_audio(session: NarrationSession, silence_gap_ms: int, output_format: str) -> tuple:
+    """
+    Export the narration to file, splicing the sentences' pieces from their `SegmentStore`. Returns the file
+    path and the number of pieces that had to be rendered.
+    """
     # Create output directory if needed
     output_dir = os.path.join(os.path.dirname(__file__), "narration_output")
     os.makedirs(output_dir, exist_ok=True)
 
     # Generate filename
-    import time
     timestamp = time.strftime("%Y%m%d_%H%M%S")
 
+    store = segment_store(session)
+    sentences = _done_sentences(session)
     if output_format == "WAV":
         output_path = os.path.join(output_dir, f"narration_{timestamp}.wav")
-        sf.write(output_path, audio_data, sample_rate)
+        silence = np.zeros(int(silence_gap_ms * SAMPLE_RATE / 1000), dtype=np.int16)
+        with sf.SoundFile(output_path, "w", samplerate=SAMPLE_RATE, channels=1, subtype="PCM_16") as f:
+            for i, sentence in enumerate(sentences):
+                if i > 0:
+                    f.write(silence)
+                f.write(store.pcm(sentence))
+        keep = {store.pcm_path(s) for s in sentences}
     else:  # MP3
-        # First write WAV to temp file
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-            tmp_wav_path = tmp.name
-            sf.write(tmp_wav_path, audio_data, sample_rate)
-
         output_path = os.path.join(output_dir, f"narration_{timestamp}.mp3")
+        # Each chunk's encoder delay plays in the gap before it, so MP3 gaps can't be much shorter than that.
+        gap_samples = max(int(silence_gap_ms * SAMPLE_RATE / 1000), MP3_MIN_GAP)
+        chunks = [store.mp3_path(s, gap_samples if i < len(sentences) - 1 else 0) for i, s in enumerate(sentences)]
+        with open(output_path + ".partial", "wb") as out:
+            for chunk in chunks:
+                with open(chunk, "rb") as f:
+                    shutil.copyfileobj(f, out)
+        os.replace(output_path + ".partial", output_path)
+        keep = {store.pcm_path(s) for s in sentences} | set(chunks)
 
-        # Convert to MP3 using ffmpeg
-        try:
-            subprocess.run(
-                [
-                    "ffmpeg", "-y",
-                    "-i", tmp_wav_path,
-                    "-acodec", "libmp3lame",
-                    "-b:a", "192k",
-                    output_path,
-                ],
-                check=True,
-                capture_output=True,
-            )
-        finally:
-            os.unlink(tmp_wav_path)
-
-    return output_path
+    store.prune(keep)
+    return output_path, store.rendered
 
 
 # =============================================================================
@@ -280,6 +647,23 @@ def export_audio(audio_data: np.ndarray, sample_rate: int, output_format: str) -
 # =============================================================================
 
 
+def handle_open_project(project_dir: str, state):
+    """Open (or create) a project directory and show its saved session."""
+    if not project_dir or not project_dir.strip():
+        return state, gr.update(), gr.update(), "Please provide a project directory", gr.update()
+
+    try:
+        session = NarrationSession.open(project_dir.strip())
+    except Exception as e:
+        return state, gr.update(), gr.update(), f"Could not open project: {e}", gr.update()
+    state["session"] = session
+
+    done_count = sum(1 for s in session.sentences if s.status == "done")
+    info = f"Opened {session.project_dir}: {done_count}/{len(session.sentences)} sentences done"
+    voice_list = [[name, "Ready"] for name in session.voices.keys()]
+    return state, session.to_dataframe(), voice_list, info, gr.update(choices=session.get_voice_names())
+
+
 def handle_script_split(script_text: str, script_file, state):
     """Handle script input and split into sentences."""
     # Get text from file or textbox
@@ -296,18 +680,20 @@ def handle_script_split(script_text: str, script_file, state):
     # Split into sentences
     sentences = split_script_to_sentences(text)
 
-    # Create session
-    session = NarrationSession()
-    session.sentences = [
-        SentenceItem(index=i, text=s) for i, s in enumerate(sentences)
-    ]
+    # Replace the script, keeping the project and its voices. Only Open Project attaches a project, since
+    # splitting replaces that project's sentences.
+    session = state.get("session", NarrationSession())
+    session.set_sentences(sentences)
+    for sentence in session.sentences:
+        sentence.voice_name = session.default_voice
+    session.save()
     state["session"] = session
 
     # Update UI
     df_data = session.to_dataframe()
     info = f"Split into {len(sentences)} sentences"
 
-    return state, df_data, gr.update(value=info), gr.update(choices=[])
+    return state, df_data, gr.update(value=info), gr.update(choices=session.get_voice_names())
 
 
 def handle_add_voice(voice_name: str, voice_audio, model_choice: str, state):
@@ -318,15 +704,11 @@ def handle_add_voice(voice_name: str, voice_audio, model_choice: str, state):
     session = state.get("session", NarrationSession())
 
     # Load model and compute embedding
-    model = load_model_if_needed(model_choice)
-    embedding = compute_speaker_embedding(voice_audio, model)
+    with MODEL_REGISTRY.lease(model_choice) as model:
+        embedding = compute_speaker_embedding(voice_audio, model)
 
     # Add to session
-    session.voices[voice_name] = VoiceProfile(
-        name=voice_name,
-        audio_path=voice_audio,
-        embedding=embedding,
-    )
+    session.add_voice(voice_name, voice_audio, embedding)
 
     # Set as default if first voice
     if session.default_voice is None:
@@ -337,6 +719,7 @@ def handle_add_voice(voice_name: str, voice_audio, model_choice: str, state):
         if sentence.voice_name is None:
             sentence.voice_name = session.default_voice
 
+    session.save()
     state["session"] = session
 
     # Update voice list display
@@ -360,7 +743,7 @@ def handle_sentence_select(evt: gr.SelectData, state):
 
     # Get audio if available
     audio_output = None
-    if sentence.audio_data is not None:
+    if sentence.has_audio:
         audio_output = (sentence.sample_rate, sentence.audio_data)
 
     return (
@@ -379,6 +762,7 @@ def handle_voice_assign(selected_idx: int, voice_name: str, state):
 
     if selected_idx < len(session.sentences):
         session.sentences[selected_idx].voice_name = voice_name
+        session.save()
         state["session"] = session
 
     return state, session.to_dataframe()
@@ -390,10 +774,19 @@ def handle_generate_all(
     cfg_scale: float,
     speaking_rate: float,
     pitch_std: float,
+    seed: int,
+    dedup: bool,
+    dedup_takes: int,
     state,
     progress=gr.Progress(),
 ):
-    """Generate audio for all sentences."""
+    """
+    Generate audio for all sentences; ones generated before with the same settings come from the cache.
+
+    Every sentence is seeded on its own. With `dedup`, sentences with the same text (ignoring case and spacing) and
+    voice share one generation instead; repeats cycle through `dedup_takes` differently seeded takes, so a refrain
+    needn't sound identical each time.
+    """
     session = state.get("session")
     if not session or not session.sentences:
         return state, [], "No sentences to generate"
@@ -401,49 +794,118 @@ def handle_generate_all(
     if not session.voices:
         return state, session.to_dataframe(), "Please add at least one voice first"
 
-    model = load_model_if_needed(model_choice)
     total = len(session.sentences)
-
-    for i, sentence in enumerate(session.sentences):
-        # Skip already done
-        if sentence.status == "done" and sentence.audio_data is not None:
-            progress((i + 1) / total, desc=f"Skipping {i+1}/{total} (already done)")
-            continue
-
-        # Get voice embedding
-        voice_name = sentence.voice_name or session.default_voice
-        if voice_name not in session.voices:
-            sentence.status = "error"
-            continue
-
-        voice = session.voices[voice_name]
-        sentence.status = "generating"
-
-        progress((i + 0.5) / total, desc=f"Generating {i+1}/{total}: {sentence.text[:30]}...")
-
-        try:
-            sr, audio = generate_single_sentence(
-                text=sentence.text,
-                speaker_embedding=voice.embedding,
-                model=model,
-                language=language,
-                cfg_scale=cfg_scale,
-                speaking_rate=speaking_rate,
-                pitch_std=pitch_std,
-            )
-            sentence.audio_data = audio
-            sentence.sample_rate = sr
-            sentence.status = "done"
-        except Exception as e:
-            print(f"Error generating sentence {i}: {e}")
-            sentence.status = "error"
-
-        progress((i + 1) / total, desc=f"Completed {i+1}/{total}")
-
+    # Leased so another session switching models can't offload this one while the sentences generate.
+    with MODEL_REGISTRY.lease(model_choice) as model:
+        # On CPU hosts, ZONOS_CPU_WORKERS > 1 spreads sentences over worker processes sharing the model's weights.
+        cpu_workers = int(os.getenv("ZONOS_CPU_WORKERS", "1"))
+        if model.device.type == "cpu" and cpu_workers > 1:
+            runner = cpu_worker_pool(model, cpu_workers)
+            scope = nullcontext()  # the pool outlives this run
+        else:
+            cpu_workers = 1
+            runner = scope = SynthesisPipeline(model)
+
+        # Keep a few sentences in flight so phonemization and DAC decode overlap with generation,
+        # and every worker has a queued sentence to pick up.
+        lookahead = max(4, 2 * cpu_workers)
+        in_flight = deque()
+        last_save = time.monotonic()
+
+        # Dedup: sentences waiting on a generation that's in flight, by (text, voice, take, variant), how many times
+        # each (text, voice, take) has come up so far, and the spelling it was first generated with.
+        shared = {}
+        repeats = {}
+        first_text = {}
+        shared_count = 0
+
+        def collect_oldest():
+            nonlocal last_save
+            i, sentences, key, dedup_key, future = in_flight.popleft()
+            shared.pop(dedup_key, None)
+            sentence = sentences[0]
+            progress((i + 0.5) / total, desc=f"Generating {i+1}/{total}: {sentence.text[:30]}...")
+            try:
+                result = future.result()
+                codes = result.codes[0].numpy().astype(np.int16)
+                for s in sentences:
+                    session.set_codes(s, codes, result.sampling_rate)
+                    s.status = "done"
+                GENERATION_CACHE.put(key, CacheEntry(codes, result.sampling_rate))
+            except Exception as e:
+                print(f"Error generating sentence {i}: {e}")
+                for s in sentences:
+                    s.status = "error"
+            # Rewriting the manifest after every sentence would be quadratic in script length.
+            if time.monotonic() - last_save > 5:
+                session.save()
+                last_save = time.monotonic()
+            progress((i + 1) / total, desc=f"Completed {i+1}/{total}")
+
+        with scope:
+            for i, sentence in enumerate(session.sentences):
+                # Skip already done
+                if sentence.status == "done" and sentence.has_audio:
+                    progress((i + 1) / total, desc=f"Skipping {i+1}/{total} (already done)")
+                    continue
+
+                # Get voice embedding
+                voice_name = sentence.voice_name or session.default_voice
+                if voice_name not in session.voices:
+                    sentence.status = "error"
+                    continue
+
+                # Without dedup each sentence draws its own seed, so repeated lines don't come back identical.
+                text, variant, dedup_key = sentence.text, sentence.index, None
+                if dedup:
+                    group = (" ".join(sentence.text.split()).casefold(), voice_name, sentence.take)
+                    # Once the group's take has finished, later repeats find it in the cache under the first spelling.
+                    text = first_text.setdefault(group, sentence.text)
+                    variant = repeats.get(group, 0) % max(int(dedup_takes), 1)
+                    repeats[group] = repeats.get(group, 0) + 1
+                    dedup_key = (*group, variant)
+                    if dedup_key in shared:
+                        shared[dedup_key].append(sentence)
+                        sentence.status = "generating"
+                        shared_count += 1
+                        continue
+
+                voice = session.voices[voice_name]
+                request = make_sentence_request(
+                    text=text,
+                    speaker_embedding=voice.embedding,
+                    language=language,
+                    cfg_scale=cfg_scale,
+                    speaking_rate=speaking_rate,
+                    pitch_std=pitch_std,
+                    seed=sentence_seed(seed, sentence.take, variant),
+                )
+                key = request_key(model_choice, request)
+                if (entry := GENERATION_CACHE.get(key)) is not None:
+                    session.set_codes(sentence, entry.codes, entry.sampling_rate)
+                    sentence.status = "done"
+                    progress((i + 1) / total, desc=f"Reused {i+1}/{total} from cache")
+                    continue
+
+                sentence.status = "generating"
+                sentences = [sentence]
+                if dedup_key is not None:
+                    shared[dedup_key] = sentences
+                in_flight.append((i, sentences, key, dedup_key, runner.submit(request)))
+                if len(in_flight) >= lookahead:
+                    collect_oldest()
+
+            while in_flight:
+                collect_oldest()
+
+    session.save()
     state["session"] = session
     done_count = sum(1 for s in session.sentences if s.status == "done")
 
-    return state, session.to_dataframe(), f"Generated {done_count}/{total} sentences"
+    info = f"Generated {done_count}/{total} sentences"
+    if shared_count:
+        info += f" ({shared_count} shared with an identical sentence)"
+    return state, session.to_dataframe(), info
 
 
 def handle_regenerate(
@@ -453,10 +915,11 @@ def handle_regenerate(
     cfg_scale: float,
     speaking_rate: float,
     pitch_std: float,
+    seed: int,
     state,
     progress=gr.Progress(),
 ):
-    """Regenerate a single sentence."""
+    """Regenerate a single sentence as a new take."""
     session = state.get("session")
     if not session or selected_idx is None or selected_idx < 0:
         return state, [], None, "No sentence selected"
@@ -470,29 +933,34 @@ def handle_regenerate(
     if voice_name not in session.voices:
         return state, session.to_dataframe(), None, "No voice assigned"
 
-    model = load_model_if_needed(model_choice)
     voice = session.voices[voice_name]
 
     progress(0.5, desc=f"Regenerating: {sentence.text[:30]}...")
 
+    sentence.take += 1
     try:
-        sr, audio = generate_single_sentence(
-            text=sentence.text,
-            speaker_embedding=voice.embedding,
-            model=model,
-            language=language,
-            cfg_scale=cfg_scale,
-            speaking_rate=speaking_rate,
-            pitch_std=pitch_std,
-        )
-        sentence.audio_data = audio
-        sentence.sample_rate = sr
+        with MODEL_REGISTRY.lease(model_choice) as model:
+            sr, codes = generate_single_sentence(
+                text=sentence.text,
+                speaker_embedding=voice.embedding,
+                model=model,
+                language=language,
+                cfg_scale=cfg_scale,
+                speaking_rate=speaking_rate,
+                pitch_std=pitch_std,
+                seed=sentence_seed(seed, sentence.take, sentence.index),
+                model_id=model_choice,
+                cache=GENERATION_CACHE,
+            )
+        session.set_codes(sentence, codes, sr)
         sentence.status = "done"
     except Exception as e:
         print(f"Error regenerating: {e}")
         sentence.status = "error"
+        session.save()
         return state, session.to_dataframe(), None, f"Error: {e}"
 
+    session.save()
     state["session"] = session
     audio_output = (sentence.sample_rate, sentence.audio_data)
 
@@ -523,14 +991,13 @@ def handle_export(silence_gap: int, output_format: str, state):
     if not session:
         return None, "No session"
 
-    sr, merged = merge_audio_segments(session, int(silence_gap))
-
-    if len(merged) == 0:
+    sentences = _done_sentences(session)
+    if not sentences:
         return None, "No audio to export"
 
     try:
-        output_path = export_audio(merged, sr, output_format)
-        return output_path, f"Exported to: {output_path}"
+        output_path, rendered = export_audio(session, int(silence_gap), output_format)
+        return output_path, f"Exported to: {output_path} ({rendered} pieces rendered, the rest reused)"
     except Exception as e:
         return None, f"Export error: {e}"
 
@@ -562,6 +1029,15 @@ def build_interface():
         # =====================================================================
         gr.Markdown("## 1. Setup")
 
+        with gr.Row():
+            project_dir = gr.Textbox(
+                label="Project Directory",
+                value=os.path.join(PROJECTS_DIR, "default"),
+                info="Open Project to save the session there; until then it's kept in memory only.",
+                scale=4,
+            )
+            open_project_btn = gr.Button("Open Project", scale=1)
+
         with gr.Row():
             # Script Input
             with gr.Column(scale=1):
@@ -613,6 +1089,7 @@ def build_interface():
             cfg_scale = gr.Slider(1.0, 5.0, value=2.0, step=0.1, label="CFG Scale")
             speaking_rate = gr.Slider(5.0, 30.0, value=15.0, step=0.5, label="Speaking Rate")
             pitch_std = gr.Slider(0.0, 300.0, value=45.0, step=1, label="Pitch Variation")
+            seed = gr.Number(value=0, precision=0, label="Seed")
 
         # =====================================================================
         # Panel 2: Sentence Editor
@@ -647,6 +1124,8 @@ def build_interface():
 
         with gr.Row():
             generate_all_btn = gr.Button("Generate All", variant="primary")
+            dedup = gr.Checkbox(label="Share audio between identical sentences", value=False)
+            dedup_takes = gr.Slider(1, 5, value=1, step=1, label="Takes per repeated sentence")
             generation_status = gr.Textbox(label="Generation Status", interactive=False)
 
         # =====================================================================
@@ -684,6 +1163,13 @@ def build_interface():
         # Event Handlers
         # =====================================================================
 
+        # Project
+        open_project_btn.click(
+            fn=handle_open_project,
+            inputs=[project_dir, state],
+            outputs=[state, sentences_df, voice_list, split_info, sentence_voice],
+        )
+
         # Script splitting
         split_btn.click(
             fn=handle_script_split,
@@ -725,7 +1211,7 @@ def build_interface():
         # Generate all
         generate_all_btn.click(
             fn=handle_generate_all,
-            inputs=[model_choice, language, cfg_scale, speaking_rate, pitch_std, state],
+            inputs=[model_choice, language, cfg_scale, speaking_rate, pitch_std, seed, dedup, dedup_takes, state],
             outputs=[state, sentences_df, generation_status],
         )
 
@@ -739,6 +1225,7 @@ def build_interface():
                 cfg_scale,
                 speaking_rate,
                 pitch_std,
+                seed,
                 state,
             ],
             outputs=[state, sentences_df, sentence_audio, generation_status],
@@ -1,9 +1,21 @@
+import argparse
+
 import torch
 import torchaudio
 from zonos.model import Zonos
 from zonos.conditioning import make_cond_dict
+from zonos.profiling import ProfileConfig, profile_region
 from zonos.utils import DEFAULT_DEVICE as device
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--profile", metavar="DIR", help="Write torch.profiler traces of generation and DAC decode to DIR.")
+parser.add_argument("--profile-steps", type=int, default=32, help="Decode steps to capture with --profile.")
+parser.add_argument("--memory-snapshot", action="store_true", help="With --profile, also write a memory snapshot.")
+args = parser.parse_args()
+profile = None
+if args.profile:
+    profile = ProfileConfig(args.profile, args.profile_steps, memory_snapshot=args.memory_snapshot)
+
 # model = Zonos.from_pretrained("Zyphra/Zonos-v0.1-hybrid", device=device)
 model = Zonos.from_pretrained("Zyphra/Zonos-v0.1-transformer", device=device)
 
@@ -15,7 +27,8 @@ torch.manual_seed(421)
 cond_dict = make_cond_dict(text="Hello, world!", speaker=speaker, language="en-us")
 conditioning = model.prepare_conditioning(cond_dict)
 
-codes = model.generate(conditioning)
+codes = model.generate(conditioning, profile=profile)
 
-wavs = model.autoencoder.decode(codes).cpu()
+with profile_region(profile, "dac_decode"):
+    wavs = model.autoencoder.decode(codes).cpu()
 torchaudio.save("sample.wav", wavs[0], model.autoencoder.sampling_rate)
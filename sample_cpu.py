@@ -1,7 +1,19 @@
+import argparse
+
 import torch
 import torchaudio
 from zonos.model import Zonos
 from zonos.conditioning import make_cond_dict
+from zonos.profiling import ProfileConfig, profile_region
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--profile", metavar="DIR", help="Write torch.profiler traces of generation and DAC decode to DIR.")
+parser.add_argument("--profile-steps", type=int, default=32, help="Decode steps to capture with --profile.")
+parser.add_argument("--memory-snapshot", action="store_true", help="With --profile, also write a memory snapshot.")
+args = parser.parse_args()
+profile = None
+if args.profile:
+    profile = ProfileConfig(args.profile, args.profile_steps, memory_snapshot=args.memory_snapshot)
 
 # Force CPU usage to avoid RTX 5090 compatibility issue
 device = torch.device("cpu")
@@ -19,10 +31,11 @@ print("Generating speech...")
 cond_dict = make_cond_dict(text="Hello, world!", speaker=speaker, language="en-us")
 conditioning = model.prepare_conditioning(cond_dict)
 
-codes = model.generate(conditioning)
+codes = model.generate(conditioning, profile=profile)
 
 print("Decoding audio...")
-wavs = model.autoencoder.decode(codes).cpu()
+with profile_region(profile, "dac_decode"):
+    wavs = model.autoencoder.decode(codes).cpu()
 torchaudio.save("sample_cpu.wav", wavs[0], model.autoencoder.sampling_rate)
 
 print("Done! Audio saved to sample_cpu.wav")
@@ -1,9 +1,21 @@
+import argparse
+
 import torch
 import soundfile as sf
 from zonos.model import Zonos
 from zonos.conditioning import make_cond_dict
+from zonos.profiling import ProfileConfig, profile_region
 from zonos.utils import DEFAULT_DEVICE as device
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--profile", metavar="DIR", help="Write torch.profiler traces of generation and DAC decode to DIR.")
+parser.add_argument("--profile-steps", type=int, default=32, help="Decode steps to capture with --profile.")
+parser.add_argument("--memory-snapshot", action="store_true", help="With --profile, also write a memory snapshot.")
+args = parser.parse_args()
+profile = None
+if args.profile:
+    profile = ProfileConfig(args.profile, args.profile_steps, memory_snapshot=args.memory_snapshot)
+
 print(f"Using device: {device}")
 print(f"PyTorch version: {torch.__version__}")
 
@@ -29,10 +41,11 @@ print("Generating speech...")
 cond_dict = make_cond_dict(text="Hello, world!", speaker=speaker, language="en-us")
 conditioning = model.prepare_conditioning(cond_dict)
 
-codes = model.generate(conditioning, disable_torch_compile=True)
+codes = model.generate(conditioning, disable_torch_compile=True, profile=profile)
 
 print("Decoding audio...")
-wavs = model.autoencoder.decode(codes).cpu()
+with profile_region(profile, "dac_decode"):
+    wavs = model.autoencoder.decode(codes).cpu()
 
 print("Saving to sample_rtx5090.wav...")
 # Use soundfile to save
@@ -0,0 +1,130 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable
+
+import torch
+
+from zonos.model import Zonos
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+class CancellationToken:
+    """Thread-safe flag checked by `Zonos.generate` between decode steps when run through this module."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise GenerationCancelled()
+
+
+@dataclass
+class GenerationEvent:
+    step: int
+    max_steps: int
+    frame: torch.Tensor | None = None  # [bsz, 9, 1] delayed frame sampled at this step
+    codes: torch.Tensor | None = None  # set on the final event only, as returned by `generate`
+
+    @property
+    def done(self) -> bool:
+        return self.codes is not None
+
+
+_DONE = object()
+
+
+async def iter_generate(
+    model: Zonos,
+    prefix_conditioning: torch.Tensor,
+    audio_prefix_codes: torch.Tensor | None = None,
+    *,
+    cancel_token: CancellationToken | None = None,
+    executor: Executor | None = None,
+    **generate_kwargs,
+) -> AsyncIterator[GenerationEvent]:
+    """
+    Run `model.generate` in `executor` (the loop's default if None), yielding a `GenerationEvent` per decode
+    step and a final one carrying the codes.
+
+    The generation is cancelled at its next step when `cancel_token` is cancelled, or when the consumer stops
+    iterating early (`break`, task cancellation) — e.g. because the client went away. A cancelled generation
+    hands its KV cache back to the model's pool right away and raises `GenerationCancelled` to the consumer.
+    A `callback` in `generate_kwargs` is still called for every step.
+    """
+    loop = asyncio.get_running_loop()
+    cancel_token = cancel_token or CancellationToken()
+    user_callback = generate_kwargs.pop("callback", None)
+    events: asyncio.Queue = asyncio.Queue()
+
+    def callback(frame: torch.Tensor, step: int, max_steps: int) -> bool:
+        cancel_token.raise_if_cancelled()
+        loop.call_soon_threadsafe(events.put_nowait, GenerationEvent(step, max_steps, frame))
+        return user_callback is None or user_callback(frame, step, max_steps)
+
+    def on_done(future: asyncio.Future):
+        if not future.cancelled():
+            future.exception()  # retrieved here so an abandoned generation doesn't log; re-raised when awaited
+        events.put_nowait(_DONE)
+
+    generate_kwargs = dict(progress_bar=False) | generate_kwargs
+    generate = functools.partial(model.generate, prefix_conditioning, audio_prefix_codes, callback=callback)
+    future = loop.run_in_executor(executor, functools.partial(generate, **generate_kwargs))
+    future.add_done_callback(on_done)
+
+    last = GenerationEvent(0, 0)
+    try:
+        while (event := await events.get()) is not _DONE:
+            last = event
+            yield event
+        yield GenerationEvent(last.step, last.max_steps, codes=await future)
+    finally:
+        if not future.done():
+            cancel_token.cancel()
+            # The worker stops at its next step; wait that long so the model is idle once the consumer is done.
+            await asyncio.wait([future])
+
+
+async def generate_async(
+    model: Zonos,
+    prefix_conditioning: torch.Tensor,
+    audio_prefix_codes: torch.Tensor | None = None,
+    *,
+    cancel_token: CancellationToken | None = None,
+    on_progress: Callable[[int, int], None] | None = None,
+    executor: Executor | None = None,
+    **generate_kwargs,
+) -> torch.Tensor:
+    """
+    Awaitable form of `iter_generate`: returns what `generate` returns. `on_progress(step, max_steps)` is
+    called on the event loop after every decode step. Cancelling the awaiting task cancels the generation.
+    """
+    events = iter_generate(
+        model,
+        prefix_conditioning,
+        audio_prefix_codes,
+        cancel_token=cancel_token,
+        executor=executor,
+        **generate_kwargs,
+    )
+    try:
+        async for event in events:
+            if event.done:
+                return event.codes
+            if on_progress is not None:
+                on_progress(event.step, event.max_steps)
+    finally:
+        await events.aclose()
@@ -1,4 +1,5 @@
 import math
+from typing import Iterator
 
 import torch
 import torchaudio
@@ -6,9 +7,10 @@ from transformers.models.dac import DacModel
 
 
 class DACAutoencoder:
-    def __init__(self):
+    def __init__(self, dac: DacModel | None = None):
         super().__init__()
-        self.dac = DacModel.from_pretrained("descript/dac_44khz")
+        # A ready-made `dac` skips the download, e.g. a randomly initialized `DacModel(DacConfig(...))` for tests.
+        self.dac = dac if dac is not None else DacModel.from_pretrained("descript/dac_44khz")
         self.dac.eval().requires_grad_(False)
         self.codebook_size = self.dac.config.codebook_size
         self.num_codebooks = self.dac.quantizer.n_codebooks
@@ -25,3 +27,28 @@ class DACAutoencoder:
     def decode(self, codes: torch.Tensor) -> torch.Tensor:
         with torch.autocast(self.dac.device.type, torch.float16, enabled=self.dac.device.type != "cpu"):
             return self.dac.decode(audio_codes=codes).audio_values.unsqueeze(1).float()
+
+    def decode_batch(self, codes: list[torch.Tensor]) -> list[torch.Tensor]:
+        """Decode several `[num_codebooks, frames]` codes of different lengths in one call, to mono waveforms."""
+        hop_length = self.dac.config.hop_length
+        max_frames = max(c.shape[-1] for c in codes)
+        # Shorter rows are padded by repeating their last frame, which colours their ends less than zero codes.
+        batch = torch.stack([torch.cat([c, c[:, -1:].expand(-1, max_frames - c.shape[-1])], dim=-1) for c in codes])
+        wavs = self.decode(batch.to(self.dac.device))[:, 0]
+        return [wav[: c.shape[-1] * hop_length] for wav, c in zip(wavs, codes)]
+
+    def decode_stream(
+        self, codes: torch.Tensor, chunk_frames: int = 256, context_frames: int = 16
+    ) -> Iterator[torch.Tensor]:
+        """
+        Decode `[num_codebooks, frames]` codes `chunk_frames` at a time, yielding mono waveform pieces, so long
+        audio never has to be decoded (or held) at once. Each chunk is decoded with `context_frames` of its
+        neighbours on both sides and then trimmed, so the seams are inaudible.
+        """
+        hop_length = self.dac.config.hop_length
+        num_frames = codes.shape[-1]
+        for start in range(0, num_frames, chunk_frames):
+            end = min(start + chunk_frames, num_frames)
+            lo, hi = max(0, start - context_frames), min(num_frames, end + context_frames)
+            wav = self.decode(codes[None, :, lo:hi].to(self.dac.device))[0, 0]
+            yield wav[(start - lo) * hop_length : (end - lo) * hop_length]
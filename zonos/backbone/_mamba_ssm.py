@@ -8,6 +8,7 @@ from zonos.config import BackboneConfig, InferenceParams
 
 class MambaSSMZonosBackbone(nn.Module):
     supported_architectures = ["transformer", "hybrid"]
+    supports_sliding_window = False
 
     def __init__(self, config: BackboneConfig):
         super().__init__()
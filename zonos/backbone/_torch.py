@@ -30,28 +30,97 @@ def apply_rotary_emb(x: torch.Tensor, freqs_cis: torch.Tensor) -> torch.Tensor:
     return x_out2.type_as(x)
 
 
+def precompute_rope_tables(
+    seq_len: int, n_elem: int, dtype: torch.dtype, device: torch.device, base: float = 10000
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """cos/sin tables of shape (seq_len, n_elem // 2), computed in float32 and stored in the model dtype."""
+    freqs_cis = precompute_freqs_cis(seq_len, n_elem, base).to(device)
+    return freqs_cis[..., 0].to(dtype).contiguous(), freqs_cis[..., 1].to(dtype).contiguous()
+
+
+def apply_rotary_emb_(x: torch.Tensor, cos: torch.Tensor, sin: torch.Tensor, out: torch.Tensor) -> torch.Tensor:
+    """
+    Same rotation as `apply_rotary_emb`, in the dtype of `x` and written into `out` (which must not alias `x`),
+    e.g. straight into a KV-cache slot.
+    x/out: (batch_size, seqlen, nheads, head_dim); cos/sin: broadcastable to (batch_size, seqlen, 1, head_dim // 2)
+    """
+    x0, x1 = x.unflatten(-1, (-1, 2)).unbind(-1)
+    if torch.compiler.is_compiling():
+        # Inductor can't lower `out=` into strided views; let it fuse the functional form into a single copy.
+        out.unflatten(-1, (-1, 2)).copy_(torch.stack([x0 * cos - x1 * sin, x1 * cos + x0 * sin], -1))
+        return out
+    out0, out1 = out.unflatten(-1, (-1, 2)).unbind(-1)
+    torch.mul(x0, cos, out=out0).addcmul_(x1, sin, value=-1)
+    torch.mul(x1, cos, out=out1).addcmul_(x0, sin)
+    return out
+
+
+def _cache_slots(inference_params: InferenceParams, seqlen: int) -> tuple[int, int]:
+    """
+    Cache index to write `seqlen` new positions at, and how many cache entries are in use afterwards.
+    With a sliding window, positions past `num_sink_tokens + sliding_window` wrap around the window's ring.
+    """
+    start = inference_params.seqlen_offset
+    window = inference_params.sliding_window
+    if window is None:
+        return start, start + seqlen
+    sink = inference_params.num_sink_tokens
+    if start + seqlen <= sink + window:
+        return start, start + seqlen
+    assert seqlen == 1, "The prefill must fit within the sink tokens and the sliding window"
+    return sink + (start - sink) % window, sink + window
+
+
+def _window_key_positions(inference_params: InferenceParams, used: int, device: torch.device) -> torch.Tensor:
+    """Rotary position of every used cache entry, numbering sinks first and then the window oldest to newest."""
+    positions = torch.arange(used, device=device)
+    sink, window = inference_params.num_sink_tokens, inference_params.sliding_window
+    total = inference_params.seqlen_offset + 1
+    if total > sink + window:
+        oldest = (total - sink) % window
+        positions[sink:] = sink + (positions[sink:] - sink - oldest) % window
+    return positions
+
+
 def _update_kv_cache(
-    k: torch.Tensor, v: torch.Tensor, inference_params: InferenceParams, layer_idx: int
-) -> torch.Tensor:
-    """k/v: (batch_size, seqlen, nheads, head_dim) or (batch_size, 1, nheads, head_dim)"""
+    k: torch.Tensor,
+    v: torch.Tensor,
+    inference_params: InferenceParams,
+    layer_idx: int,
+    cos: torch.Tensor,
+    sin: torch.Tensor,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Rotates `k` directly into its cache slot and copies `v` next to it. With a sliding window `k` is stored
+    unrotated, since the positions of cached keys shift as the window slides.
+    k/v: (batch_size, seqlen, nheads, head_dim) or (batch_size, 1, nheads, head_dim)
+    Returns the used part of the head-major cache as k/v of shape (batch_size, nheads, used, head_dim).
+    """
     assert layer_idx in inference_params.key_value_memory_dict
     kv_cache, _ = inference_params.key_value_memory_dict[layer_idx]
     # Adjust key and value for inference
     batch_start = inference_params.batch_size_offset
     batch_end = batch_start + k.shape[0]
-    sequence_start = inference_params.seqlen_offset
+    sequence_start, used = _cache_slots(inference_params, k.shape[1])
     sequence_end = sequence_start + k.shape[1]
     assert batch_end <= kv_cache.shape[0]
-    assert sequence_end <= kv_cache.shape[1]
+    assert sequence_end <= kv_cache.shape[3]
     assert kv_cache is not None
-    kv_cache[batch_start:batch_end, sequence_start:sequence_end, 0, ...] = k
-    kv_cache[batch_start:batch_end, sequence_start:sequence_end, 1, ...] = v
-    return kv_cache[batch_start:batch_end, :sequence_end, ...]
+    slot = kv_cache[batch_start:batch_end, :, :, sequence_start:sequence_end]
+    if inference_params.sliding_window is None:
+        apply_rotary_emb_(k, cos, sin, out=slot[:, 0].transpose(1, 2))
+    else:
+        slot[:, 0].copy_(k.transpose(1, 2))
+    slot[:, 1].copy_(v.transpose(1, 2))
+    kv = kv_cache[batch_start:batch_end, :, :, :used]
+    return kv[:, 0], kv[:, 1]
 
 
 class TorchZonosBackbone(nn.Module):
     supported_architectures = ["transformer"]
-    freqs_cis: torch.Tensor
+    supports_sliding_window = True
+    rope_cos: torch.Tensor
+    rope_sin: torch.Tensor
 
     def __init__(self, config: BackboneConfig):
         assert not config.ssm_cfg, "This backbone implementation only supports the Transformer model."
@@ -62,21 +131,36 @@ class TorchZonosBackbone(nn.Module):
         self.norm_f = nn.LayerNorm(config.d_model, eps=config.norm_epsilon)
 
     def allocate_inference_cache(self, batch_size: int, max_seqlen: int, dtype: torch.dtype = torch.bfloat16):
-        # TODO: This function should be pure
-        head_dim = self.config.d_model // self.config.attn_cfg["num_heads"]
-        self.freqs_cis = precompute_freqs_cis(16384, head_dim)
+        # The rotary tables only depend on the config, so they are built once per device and dtype, not per cache.
+        weight = self.norm_f.weight
+        rope_cos = getattr(self, "rope_cos", None)
+        if rope_cos is None or rope_cos.device != weight.device or rope_cos.dtype != weight.dtype:
+            head_dim = self.config.d_model // self.config.attn_cfg["num_heads"]
+            self.rope_cos, self.rope_sin = precompute_rope_tables(16384, head_dim, weight.dtype, weight.device)
         return {
             i: layer.allocate_inference_cache(batch_size, max_seqlen, dtype=dtype)
             for i, layer in enumerate(self.layers)
         }
 
     def forward(self, hidden_states: torch.Tensor, inference_params: InferenceParams) -> torch.Tensor:
-        input_pos = torch.arange(0, hidden_states.shape[1], device=hidden_states.device)
-        input_pos = input_pos + inference_params.lengths_per_sample.unsqueeze(-1)
-
-        freqs_cis = self.freqs_cis[input_pos].expand(hidden_states.shape[0], -1, -1, -1)
+        key_rope = None
+        if inference_params.sliding_window is None:
+            input_pos = torch.arange(0, hidden_states.shape[1], device=hidden_states.device)
+            input_pos = input_pos + inference_params.lengths_per_sample.unsqueeze(-1)
+        else:
+            # Attention-sink style: rotary positions are cache-relative, so queries sit right after the newest
+            # cached key and keys are rotated at read time by their current rank in the cache.
+            _, used = _cache_slots(inference_params, hidden_states.shape[1])
+            assert used <= self.rope_cos.shape[0], "Sink tokens plus sliding window exceed the rotary table"
+            input_pos = torch.arange(used - hidden_states.shape[1], used, device=hidden_states.device)
+            key_pos = _window_key_positions(inference_params, used, hidden_states.device)
+            key_rope = self.rope_cos[key_pos], self.rope_sin[key_pos]
+
+        # Gathered once per step and shared by every layer: (batch_size, seqlen, 1, head_dim // 2)
+        cos = self.rope_cos[input_pos].unsqueeze(-2)
+        sin = self.rope_sin[input_pos].unsqueeze(-2)
         for i, layer in enumerate(self.layers):
-            hidden_states = layer(hidden_states, inference_params, freqs_cis)
+            hidden_states = layer(hidden_states, inference_params, cos, sin, key_rope)
         return self.norm_f(hidden_states)
 
 
@@ -94,10 +178,18 @@ class TransformerBlock(nn.Module):
         self.head_dim = config.d_model // config.attn_cfg["num_heads"]
 
     def allocate_inference_cache(self, batch_size: int, max_seqlen: int, dtype: torch.dtype = torch.bfloat16):
-        return torch.empty(batch_size, max_seqlen, 2, self.num_heads_kv, self.head_dim, dtype=dtype), None
-
-    def forward(self, x: torch.Tensor, inference_params: InferenceParams, freqs_cis: torch.Tensor) -> torch.Tensor:
-        x = x + self.mixer(self.norm(x), inference_params, freqs_cis)
+        # Head-major, so the used prefix of each of K and V is directly consumable by attention without transposes.
+        return torch.empty(batch_size, 2, self.num_heads_kv, max_seqlen, self.head_dim, dtype=dtype), None
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        inference_params: InferenceParams,
+        cos: torch.Tensor,
+        sin: torch.Tensor,
+        key_rope: tuple[torch.Tensor, torch.Tensor] | None = None,
+    ) -> torch.Tensor:
+        x = x + self.mixer(self.norm(x), inference_params, cos, sin, key_rope)
         x = x + self.mlp(self.norm2(x))
         return x
 
@@ -114,7 +206,14 @@ class Attention(nn.Module):
         self.in_proj = nn.Linear(config.d_model, total_head_dim, bias=False)
         self.out_proj = nn.Linear(self.num_heads * self.head_dim, config.d_model, bias=False)
 
-    def forward(self, x: torch.Tensor, inference_params: InferenceParams, freqs_cis: torch.Tensor) -> torch.Tensor:
+    def forward(
+        self,
+        x: torch.Tensor,
+        inference_params: InferenceParams,
+        cos: torch.Tensor,
+        sin: torch.Tensor,
+        key_rope: tuple[torch.Tensor, torch.Tensor] | None = None,
+    ) -> torch.Tensor:
         batch_size, seqlen, _ = x.shape
 
         q_size = self.num_heads * self.head_dim
@@ -125,17 +224,16 @@ class Attention(nn.Module):
         k = k.view(batch_size, seqlen, self.num_heads_kv, self.head_dim)
         v = v.view(batch_size, seqlen, self.num_heads_kv, self.head_dim)
 
-        q = apply_rotary_emb(q, freqs_cis)
-        k = apply_rotary_emb(k, freqs_cis)
-
-        kv = _update_kv_cache(k, v, inference_params, self.layer_idx)
-        k, v = kv.unbind(dim=-3)
-
-        q, k, v = map(lambda x: x.transpose(1, 2), (q, k, v))
+        # Rotate q into a head-major buffer so it needs no transpose copy either.
+        q_out = q.new_empty(batch_size, self.num_heads, seqlen, self.head_dim).transpose(1, 2)
+        q = apply_rotary_emb_(q, cos, sin, out=q_out).transpose(1, 2)
+        k, v = _update_kv_cache(k, v, inference_params, self.layer_idx, cos, sin)
+        if key_rope is not None:
+            k = apply_rotary_emb_(k, *key_rope, out=torch.empty_like(k))
 
         y = F.scaled_dot_product_attention(q, k, v, is_causal=seqlen > 1, enable_gqa=True)
 
-        y = y.transpose(1, 2).contiguous().view(batch_size, seqlen, q_size)
+        y = y.transpose(1, 2).reshape(batch_size, seqlen, q_size)
 
         y = self.out_proj(y)
         return y
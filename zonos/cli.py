@@ -0,0 +1,231 @@
+"""
+Batch synthesis from a manifest, without the UI.
+
+The manifest is JSONL (one object per line) or CSV with a header row. Fields per row:
+
+    text           required
+    voice          audio file to clone the speaker from; unconditional speaker if empty
+    language       default --language
+    speaking_rate  default 15.0
+    seed           random if empty
+    output         output path, relative to --output-dir; default <row number>.wav
+
+Speaker embeddings are computed once per voice file and prepared conditioning is cached per unique
+(text, voice, language, rate), so retakes of a line only pay for decoding. Rows are generated --batch-size at a
+time, each batched only with rows of the same phoneme count, so a seeded row sounds the same in any manifest.
+Every finished row is appended to a journal in the output directory; rerunning the same command skips rows
+already in the journal whose output exists and whose inputs haven't changed, so an interrupted run picks up
+where it stopped.
+
+Usage:
+    zonos script.jsonl --output-dir out --batch-size 4
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import time
+from functools import lru_cache
+
+import soundfile as sf
+import torch
+
+from zonos.conditioning import make_cond_dict
+from zonos.generation_cache import generation_key
+from zonos.model import Zonos
+from zonos.sampling import make_generators
+from zonos.utils import DEFAULT_DEVICE
+
+
+def read_manifest(path: str) -> list[dict]:
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    # CSV cells are strings and empty cells mean "use the default", same as a missing JSON key.
+    return [{k: v for k, v in row.items() if v not in ("", None)} for row in rows]
+
+
+def read_journal(path: str) -> set[tuple[str, str | None]]:
+    """
+    (output, key) of every row the journal records as finished. A last line cut short by a killed run is
+    trimmed off, so the next entry starts on a line of its own.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        complete = data[: data.rfind(b"\n") + 1]
+        if len(complete) < len(data):
+            f.truncate(len(complete))
+    done = set()
+    for line in complete.decode("utf-8", errors="replace").splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        done.add((entry["output"], entry.get("key")))
+    return done
+
+
+def row_key(args: argparse.Namespace, row: dict) -> str:
+    """Hash of everything that determines a row's audio, so editing a row regenerates it."""
+    return generation_key(
+        args.model,
+        row["text"],
+        None,
+        int(row["seed"]) if "seed" in row else None,
+        voice=row.get("voice"),
+        language=row.get("language", args.language),
+        speaking_rate=float(row.get("speaking_rate", 15.0)),
+        cfg_scale=args.cfg_scale,
+        min_p=args.min_p,
+        max_new_tokens=args.max_new_tokens,
+    )
+
+
+def load_audio(path: str) -> tuple[torch.Tensor, int]:
+    data, sr = sf.read(path, dtype="float32", always_2d=True)
+    return torch.from_numpy(data.T.copy()), sr
+
+
+class ManifestRunner:
+    def __init__(self, model: Zonos, args: argparse.Namespace):
+        self.model = model
+        self.args = args
+        self.speaker_embedding = lru_cache(maxsize=None)(self._speaker_embedding)
+        self.conditioning = lru_cache(maxsize=args.cache_size)(self._conditioning)
+
+    def _speaker_embedding(self, voice: str) -> torch.Tensor:
+        return self.model.make_speaker_embedding(*load_audio(voice))
+
+    def _conditioning(self, text: str, voice: str | None, language: str, speaking_rate: float) -> torch.Tensor:
+        cond_dict = make_cond_dict(
+            text=text,
+            language=language,
+            speaker=self.speaker_embedding(voice) if voice else None,
+            speaking_rate=speaking_rate,
+            device=self.model.device,
+        )
+        return self.model.prepare_conditioning(cond_dict)
+
+    def row_conditioning(self, row: dict) -> torch.Tensor:
+        return self.conditioning(
+            row["text"],
+            row.get("voice"),
+            row.get("language", self.args.language),
+            float(row.get("speaking_rate", 15.0)),
+        )
+
+    @torch.inference_mode()
+    def run_batch(self, rows: list[dict]) -> list[tuple[torch.Tensor, int]]:
+        model = self.model
+        seeds = [int(row["seed"]) if "seed" in row else random.randrange(2**63) for row in rows]
+        codes, lengths = model.generate(
+            model.batch_conditioning([self.row_conditioning(row) for row in rows]),
+            max_new_tokens=self.args.max_new_tokens,
+            cfg_scale=self.args.cfg_scale,
+            batch_size=len(rows),
+            sampling_params=dict(min_p=self.args.min_p),
+            progress_bar=False,
+            disable_torch_compile=self.args.disable_torch_compile,
+            generator=make_generators(seeds, model.device),
+            return_lengths=True,
+        )
+        wavs = model.autoencoder.decode(codes).cpu()
+        samples_per_frame = wavs.shape[-1] // codes.shape[-1]
+        return [(wavs[i, 0, : n * samples_per_frame], n) for i, n in enumerate(lengths.tolist())]
+
+
+def _batches(rows: list[dict], batch_size: int, runner: ManifestRunner):
+    # Rows with and without a voice have different conditioning layouts, so they can't share a batch. Rows of
+    # different conditioning lengths could, but padding a row changes its audio, and a seeded row must come out
+    # the same whichever rows it is batched with.
+    pending: dict[tuple, list[dict]] = {}
+    for row in rows:
+        key = ("voice" in row, runner.row_conditioning(row).shape[1])
+        batch = pending.setdefault(key, [])
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield pending.pop(key)
+    yield from pending.values()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSONL or CSV manifest.")
+    parser.add_argument("--output-dir", default="zonos_output")
+    parser.add_argument("--journal", help="Progress journal; default <output-dir>/journal.jsonl.")
+    parser.add_argument("--model", default="Zyphra/Zonos-v0.1-transformer")
+    parser.add_argument("--device", default=DEFAULT_DEVICE)
+    parser.add_argument("--language", default="en-us")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--cfg-scale", type=float, default=2.0)
+    parser.add_argument("--min-p", type=float, default=0.1)
+    parser.add_argument("--max-new-tokens", type=int, default=86 * 30)
+    parser.add_argument("--cache-size", type=int, default=256, help="Prepared conditionings kept for reuse.")
+    parser.add_argument("--disable-torch-compile", action="store_true")
+    args = parser.parse_args()
+
+    rows = read_manifest(args.manifest)
+    os.makedirs(args.output_dir, exist_ok=True)
+    journal_path = args.journal or os.path.join(args.output_dir, "journal.jsonl")
+    done = read_journal(journal_path)
+
+    pending = []
+    for i, row in enumerate(rows):
+        if "text" not in row:
+            raise SystemExit(f"{args.manifest}: row {i + 1} has no text")
+        row["output"] = os.path.join(args.output_dir, row.get("output", f"{i + 1:05d}.wav"))
+        row["key"] = row_key(args, row)
+        if (row["output"], row["key"]) in done and os.path.exists(row["output"]):
+            continue
+        os.makedirs(os.path.dirname(row["output"]) or ".", exist_ok=True)
+        pending.append(row)
+    print(f"{len(rows) - len(pending)} of {len(rows)} rows already done, {len(pending)} to go")
+    if not pending:
+        return
+
+    model = Zonos.from_pretrained(args.model, device=args.device)
+    model.requires_grad_(False).eval()
+    runner = ManifestRunner(model, args)
+    sampling_rate = model.autoencoder.sampling_rate
+
+    start = time.perf_counter()
+    finished, audio_seconds = 0, 0.0
+    with open(journal_path, "a", encoding="utf-8") as journal:
+        for batch in _batches(pending, args.batch_size, runner):
+            for row, (wav, frames) in zip(batch, runner.run_batch(batch)):
+                # Write under a temporary name first, so an interrupted write never looks finished.
+                root, ext = os.path.splitext(row["output"])
+                tmp_path = f"{root}.partial{ext}"
+                sf.write(tmp_path, wav.numpy(), sampling_rate)
+                os.replace(tmp_path, row["output"])
+
+                seconds = len(wav) / sampling_rate
+                entry = {"output": row["output"], "key": row["key"], "frames": frames, "seconds": seconds}
+                journal.write(json.dumps(entry) + "\n")
+                journal.flush()
+                finished += 1
+                audio_seconds += seconds
+
+            elapsed = time.perf_counter() - start
+            print(
+                f"[{finished}/{len(pending)}] {audio_seconds:.1f}s of audio in {elapsed:.1f}s"
+                f" (RTF {elapsed / max(audio_seconds, 1e-9):.3f}, {finished / elapsed:.2f} rows/s)"
+            )
+
+    elapsed = time.perf_counter() - start
+    cache = runner.conditioning.cache_info()
+    print(
+        f"Done: {finished} rows, {audio_seconds:.1f}s of audio in {elapsed:.1f}s"
+        f" (RTF {elapsed / max(audio_seconds, 1e-9):.3f}, {audio_seconds / elapsed:.2f}s audio/s);"
+        f" conditioning cache {cache.hits} hits / {cache.misses} misses"
+    )
+
+
+if __name__ == "__main__":
+    main()
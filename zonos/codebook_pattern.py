@@ -1,12 +1,56 @@
+from functools import lru_cache
+
 import torch
-import torch.nn.functional as F
 
 
-def apply_delay_pattern(codes: torch.Tensor, mask_token: int):
-    codes = F.pad(codes, (0, codes.shape[1]), value=mask_token)
-    return torch.stack([codes[:, k].roll(k + 1) for k in range(codes.shape[1])], dim=1)
+@lru_cache(maxsize=64)
+def _delay_index(n_q: int, seq_len: int, device: torch.device) -> tuple[torch.Tensor, torch.Tensor]:
+    """For each delayed position, the source frame in the undelayed codes and whether it is a mask position."""
+    src = torch.arange(seq_len + n_q, device=device) - torch.arange(1, n_q + 1, device=device).unsqueeze(1)
+    masked = (src < 0) | (src >= seq_len)
+    return src.clamp_(0, max(seq_len - 1, 0)), masked
+
+
+@lru_cache(maxsize=64)
+def _revert_index(n_q: int, num_frames: int, device: torch.device) -> torch.Tensor:
+    """For each undelayed frame, its position in the delayed codes: codebook k is shifted right by k + 1."""
+    return torch.arange(num_frames, device=device) + torch.arange(1, n_q + 1, device=device).unsqueeze(1)
+
+
+def apply_delay_pattern(codes: torch.Tensor, mask_token: int, out: torch.Tensor | None = None) -> torch.Tensor:
+    """[batch_size, n_q, seq_len] -> [batch_size, n_q, seq_len + n_q], codebook k delayed by k + 1 frames.
+
+    Implemented as a single gather with a cached index, optionally into a preallocated `out` buffer.
+    """
+    batch_size, n_q, seq_len = codes.shape
+    if seq_len == 0:
+        shape = (batch_size, n_q, n_q)
+        return codes.new_full(shape, mask_token) if out is None else out.fill_(mask_token)
+    src, masked = _delay_index(n_q, seq_len, codes.device)
+    out = torch.gather(codes, 2, src.expand(batch_size, -1, -1), out=out)
+    return out.masked_fill_(masked, mask_token)
+
+
+def revert_delay_pattern(codes: torch.Tensor, out: torch.Tensor | None = None) -> torch.Tensor:
+    """Inverse of `apply_delay_pattern`: [batch_size, n_q, seq_len] -> [batch_size, n_q, seq_len - n_q]."""
+    batch_size, n_q, seq_len = codes.shape
+    index = _revert_index(n_q, max(seq_len - n_q, 0), codes.device)
+    return torch.gather(codes, 2, index.expand(batch_size, -1, -1), out=out)
+
+
+def num_complete_frames(delayed_len: int, n_q: int) -> int:
+    """Number of undelayed frames fully determined by the first `delayed_len` delayed positions."""
+    return max(delayed_len - n_q, 0)
+
 
+def revert_delay_pattern_frames(
+    codes: torch.Tensor, start: int, end: int, out: torch.Tensor | None = None
+) -> torch.Tensor:
+    """Revert only undelayed frames [start, end), reading delayed positions up to `end + n_q`.
 
-def revert_delay_pattern(codes: torch.Tensor):
-    _, n_q, seq_len = codes.shape
-    return torch.stack([codes[:, k, k + 1 : seq_len - n_q + k + 1] for k in range(n_q)], dim=1)
+    Lets a streaming decoder convert just the newly completed frames each step
+    (see `num_complete_frames`) instead of reverting the whole sequence.
+    """
+    n_q = codes.shape[1]
+    assert 0 <= start <= end and end + n_q <= codes.shape[2], "Frames are not complete yet"
+    return revert_delay_pattern(codes[..., start : end + n_q], out=out)
@@ -55,6 +55,7 @@ class Conditioner(nn.Module):
 import os
 import sys
 import re
+import threading
 import unicodedata
 
 import inflect
@@ -204,18 +205,58 @@ def get_backend(language: str) -> "EspeakBackend":
     return backend
 
 
+# espeak-ng keeps global state, and the Japanese tokenizer used by `clean` is shared, so neither may run on two
+# threads at once.
+_phonemize_lock = threading.Lock()
+
+
 def phonemize(texts: list[str], languages: list[str]) -> list[str]:
-    texts = clean(texts, languages)
+    with _phonemize_lock:
+        texts = clean(texts, languages)
 
-    batch_phonemes = []
-    for text, language in zip(texts, languages):
-        backend = get_backend(language)
-        phonemes = backend.phonemize([text], strip=True)
-        batch_phonemes.append(phonemes[0])
+        batch_phonemes = []
+        for text, language in zip(texts, languages):
+            backend = get_backend(language)
+            phonemes = backend.phonemize([text], strip=True)
+            batch_phonemes.append(phonemes[0])
 
     return batch_phonemes
 
 
+# CJK full stops end a sentence with or without whitespace after them, unless a closing quote or bracket follows.
+_sentence_end_re = re.compile(r"(?<=[.!?])\s+|(?<=[。！？])(?![」』）”\"])\s*")
+
+
+def split_text_by_phonemes(text: str, language: str, max_phonemes: int = 300) -> list[str]:
+    """
+    Split `text` into chunks of whole sentences holding at most `max_phonemes` phonemes each,
+    so every chunk fits comfortably within a single generation. Sentences longer than the
+    budget become chunks of their own.
+    """
+    sentences = [s for s in _sentence_end_re.split(" ".join(text.split())) if s]
+    if not sentences:
+        return []
+    lengths = [len(p) for p in phonemize(sentences, [language] * len(sentences))]
+
+    chunks, current, current_len = [], [], 0
+    for sentence, length in zip(sentences, lengths):
+        if current and current_len + length > max_phonemes:
+            chunks.append(" ".join(current))
+            current, current_len = [], 0
+        current.append(sentence)
+        current_len += length
+    chunks.append(" ".join(current))
+    return chunks
+
+
+def continuation_texts(chunks: list[str]) -> list[str]:
+    """
+    Texts to generate the chunks of `split_text_by_phonemes` from when each one continues from the previous
+    chunk's codes as `audio_prefix_codes`: the model expects the prefix's transcript at the start of the text.
+    """
+    return [f"{previous} {chunk}" if previous else chunk for previous, chunk in zip(["", *chunks], chunks)]
+
+
 class EspeakPhonemeConditioner(Conditioner):
     def __init__(self, output_dim: int, **kwargs):
         super().__init__(output_dim, **kwargs)
@@ -403,3 +444,24 @@ def make_cond_dict(
             cond_dict[k] /= cond_dict[k].sum(dim=-1)
 
     return cond_dict
+
+
+def merge_cond_dicts(cond_dicts: list[dict]) -> dict:
+    """
+    Batch several single-row dicts from `make_cond_dict` into one, so their requests can share a `generate` call.
+    All dicts must have the same keys, with `None` for the same keys; phonemes are left-padded by `tokenize_phonemes`.
+    """
+    keys = cond_dicts[0].keys()
+    assert all(d.keys() == keys for d in cond_dicts), "All cond_dicts must have the same keys"
+    merged = {}
+    for k in keys:
+        values = [d[k] for d in cond_dicts]
+        if k == "espeak":
+            texts = [text for batch_texts, _ in values for text in batch_texts]
+            merged[k] = (texts, [language for _, languages in values for language in languages])
+        elif all(v is None for v in values):
+            merged[k] = None
+        else:
+            # Conditioners unpack their input along dim 0, so the batched tensor goes in as a single argument.
+            merged[k] = (torch.cat(values, dim=0),)
+    return merged
@@ -16,6 +16,10 @@ class InferenceParams:
     batch_size_offset: int = 0
     key_value_memory_dict: dict = field(default_factory=dict)
     lengths_per_sample: torch.Tensor | None = None
+    # Bounded-context decoding: keep the first `num_sink_tokens` positions plus a ring of the most recent
+    # `sliding_window` positions in the KV cache. Only supported by backbones with `supports_sliding_window`.
+    sliding_window: int | None = None
+    num_sink_tokens: int = 0
 
     def reset(self, max_seqlen, max_batch_size):
         self.max_seqlen = max_seqlen
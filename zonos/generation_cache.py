@@ -0,0 +1,133 @@
+"""
+On-disk cache of generated sentences, so re-running a script only pays for the lines that changed.
+
+Entries are keyed by a hash of everything that determines the output — model, text, speaker embedding, audio
+prefix, language, conditioning and sampling settings, and seed — and hold the generated DAC codes, over 100x
+smaller than the audio they decode to (see `DACAutoencoder.decode_batch` and `decode_stream`). Generation is only
+reproducible with a seed, so callers should not cache unseeded requests. When the cache grows past `max_bytes` the least
+recently used entries are deleted.
+
+Usage:
+    cache = GenerationCache("zonos_cache")
+    key = request_key("Zyphra/Zonos-v0.1-transformer", request)
+    if (entry := cache.get(key)) is None:
+        entry = ...  # generate
+        cache.put(key, entry)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+
+import numpy as np
+import torch
+
+from zonos.pipeline import SynthesisRequest
+
+
+@dataclass
+class CacheEntry:
+    codes: np.ndarray  # [num_codebooks, frames] int16
+    sampling_rate: int
+
+
+def _update_with_tensor(h, tensor: torch.Tensor):
+    tensor = tensor.detach().cpu().contiguous()
+    h.update(f"{tensor.dtype}{tuple(tensor.shape)}".encode())
+    h.update(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+
+
+def generation_key(model_id: str, text: str, speaker: torch.Tensor | None, seed: int | None, **settings) -> str:
+    """
+    Hash of one generation's inputs. `settings` must be JSON-serializable apart from tensors and arrays, which are
+    hashed by dtype, shape and contents; anything else hashes by `str`.
+    """
+    h = hashlib.sha256()
+    tensors = []
+
+    def default(value):
+        if isinstance(value, (torch.Tensor, np.ndarray)):
+            tensors.append(torch.as_tensor(value))
+            return f"<tensor {len(tensors) - 1}>"
+        return str(value)
+
+    h.update(json.dumps([model_id, text, seed, settings], sort_keys=True, default=default).encode())
+    for tensor in [*tensors, *([] if speaker is None else [speaker])]:
+        _update_with_tensor(h, tensor)
+    return h.hexdigest()
+
+
+def request_key(model_id: str, request: SynthesisRequest) -> str:
+    return generation_key(
+        model_id,
+        request.text,
+        request.speaker,
+        request.seed,
+        language=request.language,
+        audio_prefix_codes=request.audio_prefix_codes,
+        cond_kwargs=request.cond_kwargs,
+        generate_kwargs=request.generate_kwargs,
+    )
+
+
+class GenerationCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sizes = {
+            entry.name: entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith(".npz")
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key: str) -> CacheEntry | None:
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                entry = CacheEntry(data["codes"], int(data["sampling_rate"]))
+        except (OSError, KeyError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mtime is the recency used for eviction
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key: str, entry: CacheEntry):
+        path = self._path(key)
+        # Write under a unique temporary name, so concurrent writers and readers never see a partial file.
+        tmp_path = os.path.join(self.cache_dir, f"{key}.{uuid.uuid4().hex[:8]}.partial")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, codes=np.asarray(entry.codes, dtype=np.int16), sampling_rate=entry.sampling_rate)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._sizes[os.path.basename(path)] = os.path.getsize(path)
+            self._evict()
+
+    def _evict(self):
+        if self.nbytes <= self.max_bytes:
+            return
+        by_age = []
+        for name in self._sizes:
+            try:
+                by_age.append((os.path.getmtime(os.path.join(self.cache_dir, name)), name))
+            except OSError:
+                by_age.append((0.0, name))
+        for _, name in sorted(by_age):
+            if self.nbytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            del self._sizes[name]
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import torch
+
+from zonos.config import InferenceParams
+from zonos.utils import find_multiple
+
+PoolKey = tuple[int, int, torch.dtype, torch.device]
+
+
+class InferenceParamsPool:
+    """Reuses preallocated inference caches across `generate` calls.
+
+    Caches are bucketed by (batch_size, max_seqlen rounded up to `seqlen_bucket`, dtype, device). `acquire` hands
+    out a free cache from the matching bucket, reset via `InferenceParams.reset`, or allocates a new one;
+    `release` returns it. At most `max_free` idle caches are kept, evicting the least recently released.
+
+    Resetting the offsets is enough for reuse: attention only reads KV entries below the current sequence end,
+    and the SSM layers overwrite their states on the first (prefill) step.
+    """
+
+    def __init__(
+        self,
+        allocate: Callable[..., dict],
+        seqlen_bucket: int = 256,
+        max_free: int = 4,
+    ):
+        self._allocate = allocate
+        self.seqlen_bucket = seqlen_bucket
+        self.max_free = max_free
+        self._free: OrderedDict[PoolKey, list[InferenceParams]] = OrderedDict()
+        self._leased: dict[int, PoolKey] = {}
+        self._lock = threading.Lock()
+
+    def acquire(
+        self, batch_size: int, max_seqlen: int, dtype: torch.dtype = torch.bfloat16, device: torch.device | None = None
+    ) -> InferenceParams:
+        device = torch.device(device) if device is not None else torch.get_default_device()
+        max_seqlen = find_multiple(max_seqlen, self.seqlen_bucket)
+        key = (batch_size, max_seqlen, dtype, device)
+
+        with self._lock:
+            free = self._free.get(key)
+            params = free.pop() if free else None
+            if free is not None and not free:
+                del self._free[key]
+
+        if params is None:
+            with torch.device(device):
+                key_value_memory_dict = self._allocate(batch_size, max_seqlen, dtype=dtype)
+                lengths_per_sample = torch.full((batch_size,), 0, dtype=torch.int32)
+            params = InferenceParams(max_seqlen, batch_size, 0, 0, key_value_memory_dict, lengths_per_sample)
+        else:
+            params.reset(max_seqlen, batch_size)
+            params.batch_size_offset = 0
+
+        with self._lock:
+            self._leased[id(params)] = key
+        return params
+
+    def release(self, params: InferenceParams):
+        with self._lock:
+            key = self._leased.pop(id(params), None)
+            if key is None:
+                return
+            self._free.setdefault(key, []).append(params)
+            self._free.move_to_end(key)
+            while sum(map(len, self._free.values())) > self.max_free:
+                oldest_key = next(iter(self._free))
+                self._free[oldest_key].pop(0)
+                if not self._free[oldest_key]:
+                    del self._free[oldest_key]
+
+    def __getstate__(self):
+        # Idle caches and the lock stay behind when a model is sent to another process (e.g. `CPUWorkerPool`).
+        state = self.__dict__.copy()
+        state.update(_free=OrderedDict(), _leased={}, _lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Drop all idle caches, e.g. before moving the model to another device."""
+        with self._lock:
+            self._free.clear()
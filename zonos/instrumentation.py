@@ -0,0 +1,221 @@
+"""
+Opt-in timing of `Zonos.generate`.
+
+Set `model.instrumentation = Instrumentation([HistogramSink(), JSONLogSink()])` and every `generate` call records
+a `GenerationStats` — prefill time, time to first token, per-step forward and sampling time (and with
+`breakdown=True` the embedding, backbone and heads separately), KV cache memory and the EOS step of every row —
+and hands it to each sink. With `model.instrumentation = None` (the default) `generate` pays for a couple of
+`is None` checks per step.
+
+Timed sections synchronize the device so GPU work lands in the section that queued it. `generate` already
+synchronizes once per step, so this costs little, but `breakdown=True` also runs the decode step eagerly
+(no torch.compile or CUDA graphs), so use it to find where time goes rather than to measure peak throughput.
+"""
+
+import json
+import math
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+from typing import IO
+
+import torch
+
+
+def _synchronize(device: torch.device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    elif device.type == "mps":
+        torch.mps.synchronize()
+
+
+class GenerationTimer:
+    def __init__(self, device: torch.device):
+        self.device = device
+        self.sections: dict[str, list[float]] = defaultdict(list)
+        self.marks: dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def section(self, name: str):
+        _synchronize(self.device)
+        start = time.perf_counter()
+        yield
+        _synchronize(self.device)
+        self.sections[name].append(time.perf_counter() - start)
+
+    def mark(self, name: str):
+        """Record the time elapsed since the timer was created."""
+        _synchronize(self.device)
+        self.marks[name] = time.perf_counter() - self._start
+
+
+def no_section(name: str):
+    return nullcontext()
+
+
+@dataclass
+class GenerationStats:
+    batch_size: int
+    prefix_length: int  # conditioning + audio prefix positions
+    steps: int
+    total_s: float
+    prefill_s: float
+    time_to_first_token_s: float
+    step_s: dict[str, list[float]] = field(default_factory=dict)  # per decode step, by section
+    kv_cache_bytes: int = 0  # allocated for this generation
+    kv_cache_used_bytes: int = 0  # holding positions at the end of the generation
+    eos_steps: list[int | None] = field(default_factory=list)  # decode step of each row's EOS, None if it had none
+
+
+def _tensor_nbytes(obj) -> int:
+    if isinstance(obj, torch.Tensor):
+        return obj.numel() * obj.element_size()
+    if isinstance(obj, (tuple, list)):
+        return sum(map(_tensor_nbytes, obj))
+    if isinstance(obj, dict):
+        return sum(map(_tensor_nbytes, obj.values()))
+    return 0
+
+
+def kv_cache_nbytes(inference_params) -> tuple[int, int]:
+    """Bytes allocated by an inference cache, and the share of them holding positions so far."""
+    allocated = _tensor_nbytes(inference_params.key_value_memory_dict)
+    used = min(inference_params.seqlen_offset, inference_params.max_seqlen) / max(inference_params.max_seqlen, 1)
+    return allocated, int(allocated * used)
+
+
+class Sink:
+    def record(self, stats: GenerationStats):
+        raise NotImplementedError()
+
+
+class Instrumentation:
+    def __init__(self, sinks: list[Sink], breakdown: bool = False):
+        self.sinks = sinks
+        self.breakdown = breakdown
+        self._lock = threading.Lock()
+
+    def start(self, device: torch.device) -> GenerationTimer:
+        return GenerationTimer(device)
+
+    def record(self, stats: GenerationStats):
+        with self._lock:
+            for sink in self.sinks:
+                sink.record(stats)
+
+
+# Upper bounds in seconds, from 100us to ~100s.
+DEFAULT_BUCKETS = tuple(10.0**e for e in (-4, -3.5, -3, -2.5, -2, -1.5, -1, -0.5, 0, 0.5, 1, 1.5, 2))
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile."""
+        if self.count == 0:
+            return math.nan
+        target, seen = q * self.count, 0
+        for bound, count in zip((*self.buckets, math.inf), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return math.inf
+
+
+class HistogramSink(Sink):
+    """Aggregates all generations in memory: latency histograms, token and generation counters, KV gauges."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self.histograms: dict[str, Histogram] = defaultdict(lambda: Histogram(self._buckets))
+        self.counters: dict[str, float] = defaultdict(float)
+        self.gauges: dict[str, float] = {}
+        self._lock = threading.Lock()  # generations are recorded on worker threads while readers snapshot
+
+    def record(self, stats: GenerationStats):
+        with self._lock:
+            self._record(stats)
+
+    def _record(self, stats: GenerationStats):
+        self.histograms["generate_seconds"].observe(stats.total_s)
+        self.histograms["prefill_seconds"].observe(stats.prefill_s)
+        self.histograms["time_to_first_token_seconds"].observe(stats.time_to_first_token_s)
+        for name, samples in stats.step_s.items():
+            histogram = self.histograms[f"step_{name}_seconds"]
+            for value in samples:
+                histogram.observe(value)
+        self.counters["generations_total"] += 1
+        self.counters["tokens_total"] += stats.steps * stats.batch_size
+        self.counters["rows_without_eos_total"] += sum(step is None for step in stats.eos_steps)
+        self.gauges["kv_cache_bytes"] = stats.kv_cache_bytes
+        self.gauges["kv_cache_used_bytes"] = stats.kv_cache_used_bytes
+
+
+class PrometheusSink(HistogramSink):
+    """`HistogramSink` that renders its metrics in the Prometheus text exposition format."""
+
+    def __init__(self, prefix: str = "zonos_", buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(buckets)
+        self.prefix = prefix
+
+    def render(self) -> str:
+        with self._lock:
+            histograms = [
+                (name, h.buckets, list(h.counts), h.sum, h.count) for name, h in sorted(self.histograms.items())
+            ]
+            counters, gauges = dict(self.counters), dict(self.gauges)
+
+        lines = []
+        for name, buckets, counts, total, count in histograms:
+            name = self.prefix + name
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else f"{bound:.6g}"
+                lines.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum {total:.9g}")
+            lines.append(f"{name}_count {count}")
+        for name, value in sorted(counters.items()):
+            lines += [f"# TYPE {self.prefix}{name} counter", f"{self.prefix}{name} {value:.9g}"]
+        for name, value in sorted(gauges.items()):
+            lines += [f"# TYPE {self.prefix}{name} gauge", f"{self.prefix}{name} {value:.9g}"]
+        return "\n".join(lines) + "\n"
+
+
+class JSONLogSink(Sink):
+    """Writes one JSON object per generation; per-step samples are summarized unless `per_step=True`."""
+
+    def __init__(self, stream: IO[str] | None = None, per_step: bool = False):
+        self.stream = stream or sys.stderr
+        self.per_step = per_step
+
+    def record(self, stats: GenerationStats):
+        record = asdict(stats)
+        if not self.per_step:
+            record["step_s"] = {
+                name: {"mean": sum(samples) / len(samples), "max": max(samples), "total": sum(samples)}
+                for name, samples in stats.step_s.items()
+                if samples
+            }
+        self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
@@ -1,4 +1,6 @@
+import functools
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable
 
 import safetensors
@@ -10,24 +12,30 @@ from tqdm import tqdm
 from zonos.autoencoder import DACAutoencoder
 from zonos.backbone import BACKBONES
 from zonos.codebook_pattern import apply_delay_pattern, revert_delay_pattern
-from zonos.conditioning import PrefixConditioner
+from zonos.conditioning import PAD_ID, PrefixConditioner, continuation_texts, make_cond_dict, split_text_by_phonemes
 from zonos.config import InferenceParams, ZonosConfig
-from zonos.sampling import sample_from_logits
+from zonos.inference_pool import InferenceParamsPool
+from zonos.instrumentation import GenerationStats, Instrumentation, kv_cache_nbytes, no_section
+from zonos.profiling import GenerationProfiler, ProfileConfig
+from zonos.sampling import RepetitionWindow, SamplingWorkspace, collate_sampling_params, sample_from_logits
 from zonos.speaker_cloning import SpeakerEmbeddingLDA
-from zonos.utils import DEFAULT_DEVICE, find_multiple, pad_weight_
+from zonos.utils import DEFAULT_DEVICE, pad_weight_
 
 DEFAULT_BACKBONE_CLS = next(iter(BACKBONES.values()))
 
 
 class Zonos(nn.Module):
-    def __init__(self, config: ZonosConfig, backbone_cls=DEFAULT_BACKBONE_CLS):
+    def __init__(
+        self, config: ZonosConfig, backbone_cls=DEFAULT_BACKBONE_CLS, autoencoder: DACAutoencoder | None = None
+    ):
         super().__init__()
         self.config = config
         dim = config.backbone.d_model
         self.eos_token_id = config.eos_token_id
         self.masked_token_id = config.masked_token_id
 
-        self.autoencoder = DACAutoencoder()
+        # Not a submodule: several models can share one autoencoder, and `.to()` on the model leaves it alone.
+        self.autoencoder = autoencoder if autoencoder is not None else DACAutoencoder()
         self.backbone = backbone_cls(config.backbone)
         self.prefix_conditioner = PrefixConditioner(config.prefix_conditioner, dim)
         self.spk_clone_model = None
@@ -43,6 +51,9 @@ class Zonos(nn.Module):
         self._cg_inference_params = None
         self._cg_scale = None
 
+        self.inference_pool = InferenceParamsPool(self.backbone.allocate_inference_cache)
+        self.instrumentation: Instrumentation | None = None  # see `zonos.instrumentation`
+
         if config.pad_vocab_to_multiple_of:
             self.register_load_state_dict_post_hook(self._pad_embeddings_and_heads)
 
@@ -64,7 +75,12 @@ class Zonos(nn.Module):
 
     @classmethod
     def from_local(
-        cls, config_path: str, model_path: str, device: str = DEFAULT_DEVICE, backbone: str | None = None
+        cls,
+        config_path: str,
+        model_path: str,
+        device: str = DEFAULT_DEVICE,
+        backbone: str | None = None,
+        autoencoder: DACAutoencoder | None = None,
     ) -> "Zonos":
         config = ZonosConfig.from_dict(json.load(open(config_path)))
         if backbone:
@@ -76,7 +92,7 @@ class Zonos(nn.Module):
             if is_transformer and "torch" in BACKBONES:
                 backbone_cls = BACKBONES["torch"]
 
-        model = cls(config, backbone_cls).to(device, torch.bfloat16)
+        model = cls(config, backbone_cls, autoencoder).to(device, torch.bfloat16)
         model.autoencoder.dac.to(device)
 
         sd = model.state_dict()
@@ -108,6 +124,9 @@ class Zonos(nn.Module):
         classifier-free guidance if `cfg_scale != 1.0`.
         """
         last_hidden_states = self.backbone(hidden_states, inference_params)[:, -1, :].unsqueeze(1)
+        return self._logits_from_hidden(last_hidden_states, cfg_scale)
+
+    def _logits_from_hidden(self, last_hidden_states: torch.Tensor, cfg_scale: float) -> torch.Tensor:
         logits = self.apply_heads(last_hidden_states).squeeze(2).float()
         if cfg_scale != 1.0:
             cond_logits, uncond_logits = logits.chunk(2)
@@ -115,6 +134,19 @@ class Zonos(nn.Module):
         logits[..., 1025:].fill_(-torch.inf)  # ensures padding is ignored
         return logits
 
+    def _decode_one_token_timed(
+        self, input_ids: torch.Tensor, inference_params: InferenceParams, cfg_scale: float, timer, **kwargs
+    ) -> torch.Tensor:
+        """Eager `_decode_one_token` timing the embedding, backbone and heads separately."""
+        with timer.section("embed"):
+            hidden_states = self.embed_codes(input_ids)
+            if cfg_scale != 1.0:
+                hidden_states = hidden_states.repeat(2, 1, 1)
+        with timer.section("backbone"):
+            last_hidden_states = self.backbone(hidden_states, inference_params)[:, -1, :].unsqueeze(1)
+        with timer.section("heads"):
+            return self._logits_from_hidden(last_hidden_states, cfg_scale)
+
     def _decode_one_token(
         self,
         input_ids: torch.Tensor,
@@ -191,15 +223,26 @@ class Zonos(nn.Module):
         """
         # Replicate input_ids if CFG is enabled
         if cfg_scale != 1.0:
-            input_ids = input_ids.expand(prefix_hidden_states.shape[0], -1, -1)
+            input_ids = input_ids.repeat(2, 1, 1)
         hidden_states = torch.cat([prefix_hidden_states, self.embed_codes(input_ids)], dim=1)
         return self._compute_logits(hidden_states, inference_params, cfg_scale)
 
-    def setup_cache(self, batch_size: int, max_seqlen: int, dtype: torch.dtype = torch.bfloat16) -> InferenceParams:
-        max_seqlen = find_multiple(max_seqlen, 8)
-        key_value_memory_dict = self.backbone.allocate_inference_cache(batch_size, max_seqlen, dtype=dtype)
-        lengths_per_sample = torch.full((batch_size,), 0, dtype=torch.int32)
-        return InferenceParams(max_seqlen, batch_size, 0, 0, key_value_memory_dict, lengths_per_sample)
+    def setup_cache(
+        self,
+        batch_size: int,
+        max_seqlen: int,
+        dtype: torch.dtype = torch.bfloat16,
+        sliding_window: int | None = None,
+        num_sink_tokens: int = 0,
+    ) -> InferenceParams:
+        """Lease an inference cache from `inference_pool`; hand it back with `release_cache` when done."""
+        inference_params = self.inference_pool.acquire(batch_size, max_seqlen, dtype=dtype, device=self.device)
+        inference_params.sliding_window = sliding_window
+        inference_params.num_sink_tokens = num_sink_tokens
+        return inference_params
+
+    def release_cache(self, inference_params: InferenceParams):
+        self.inference_pool.release(inference_params)
 
     def prepare_conditioning(self, cond_dict: dict, uncond_dict: dict | None = None) -> torch.Tensor:
         if uncond_dict is None:
@@ -211,6 +254,26 @@ class Zonos(nn.Module):
             ]
         )
 
+    def batch_conditioning(self, conditionings: list[torch.Tensor]) -> torch.Tensor:
+        """
+        Combine single-request outputs of `prepare_conditioning` ([2, seq_len, d_model] each) into the
+        [2 * batch_size, seq_len, d_model] layout `generate` expects, so prepared conditioning can be cached and
+        reused across batches. Shorter phoneme sequences are left-padded the way a batched `prepare_conditioning`
+        would: every conditioner is applied position-wise and all but the phonemes produce one position each.
+        """
+        longest = max(c.shape[1] for c in conditionings)
+        if any(c.shape[1] != longest for c in conditionings):
+            names = [c.name for c in self.prefix_conditioner.conditioners]
+            espeak = self.prefix_conditioner.conditioners[names.index("espeak")]
+            offset = names.index("espeak")  # positions before the phonemes
+            pad = espeak.project(espeak.phoneme_embedder.weight[PAD_ID])
+            pad = self.prefix_conditioner.norm(self.prefix_conditioner.project(pad))
+            conditionings = [
+                torch.cat([c[:, :offset], pad.expand(2, longest - c.shape[1], -1), c[:, offset:]], dim=1)
+                for c in conditionings
+            ]
+        return torch.cat([c[:1] for c in conditionings] + [c[1:] for c in conditionings])
+
     def can_use_cudagraphs(self) -> bool:
         # Only the mamba-ssm backbone supports CUDA Graphs at the moment
         return self.device.type == "cuda" and "_mamba_ssm" in str(self.backbone.__class__)
@@ -223,26 +286,83 @@ class Zonos(nn.Module):
         max_new_tokens: int = 86 * 30,
         cfg_scale: float = 2.0,
         batch_size: int = 1,
-        sampling_params: dict = dict(min_p=0.1),
+        sampling_params: dict | list[dict] = dict(min_p=0.1),
         progress_bar: bool = True,
         disable_torch_compile: bool = False,
         callback: Callable[[torch.Tensor, int, int], bool] | None = None,
+        generator: torch.Generator | list[torch.Generator | None] | None = None,
+        sliding_window: int | None = None,
+        return_lengths: bool = False,
+        profile: ProfileConfig | str | None = None,
     ):
+        """
+        `sampling_params` is either one dict for the whole batch or a list with one dict per row, so requests
+        with different sampling settings can be decoded together.
+
+        `generator` may be a single generator for the whole batch or a list with one generator per row
+        (see `zonos.sampling.make_generators`). With per-row generators a row's sampled tokens don't depend
+        on which other requests share the batch; `None` entries fall back to the global RNG.
+
+        `sliding_window` enables bounded-context generation for long-form audio: the KV cache keeps the
+        conditioning and audio prefix plus only the most recent `sliding_window` frames (attention-sink style),
+        so per-step cost and cache memory stay constant however large `max_new_tokens` is.
+
+        With `return_lengths`, also returns the number of frames before each row's EOS, since rows that finish
+        early are padded with zero codes up to the longest row.
+
+        `profile` (a `zonos.profiling.ProfileConfig`, or just an output directory) writes a `torch.profiler`
+        trace of the prefill and the first decode steps. The decode step then runs eagerly, without
+        torch.compile or CUDA graphs, so that modules show up in the trace.
+        """
         assert cfg_scale != 1, "TODO: add support for cfg_scale=1"
+        if isinstance(generator, (list, tuple)) and len(generator) != batch_size:
+            raise ValueError(f"Expected {batch_size} generators, got {len(generator)}")
+        if isinstance(sampling_params, (list, tuple)):
+            if len(sampling_params) != batch_size:
+                raise ValueError(f"Expected {batch_size} sampling_params, got {len(sampling_params)}")
+            sampling_params = collate_sampling_params(sampling_params, device=self.device)
         prefix_audio_len = 0 if audio_prefix_codes is None else audio_prefix_codes.shape[2]
         device = self.device
 
+        instrumentation = self.instrumentation
+        timer = instrumentation.start(device) if instrumentation is not None else None
+        section = timer.section if timer is not None else no_section
+
         # Use CUDA Graphs if supported, and torch.compile otherwise.
         cg = self.can_use_cudagraphs()
         decode_one_token = self._decode_one_token
         decode_one_token = torch.compile(decode_one_token, dynamic=True, disable=cg or disable_torch_compile)
+        if timer is not None and instrumentation.breakdown:
+            cg = False
+            decode_one_token = functools.partial(self._decode_one_token_timed, timer=timer)
+
+        profiler = None
+        if profile is not None:
+            profiler = GenerationProfiler(self, ProfileConfig(profile) if isinstance(profile, str) else profile)
+            section = profiler.wrap_section(section)
+            cg = False
+            if not isinstance(decode_one_token, functools.partial):
+                decode_one_token = self._decode_one_token
 
         unknown_token = -1
         audio_seq_len = prefix_audio_len + max_new_tokens
         seq_len = prefix_conditioning.shape[1] + audio_seq_len + 9
+        prefix_length = prefix_conditioning.shape[1] + prefix_audio_len + 1
+
+        num_sink_tokens = 0
+        if sliding_window is not None:
+            if not getattr(self.backbone, "supports_sliding_window", False):
+                raise NotImplementedError(f"{type(self.backbone).__name__} does not support sliding_window")
+            num_sink_tokens = prefix_length
+            seq_len = min(seq_len, num_sink_tokens + sliding_window)
 
         with torch.device(device):
-            inference_params = self.setup_cache(batch_size=batch_size * 2, max_seqlen=seq_len)
+            inference_params = self.setup_cache(
+                batch_size=batch_size * 2,
+                max_seqlen=seq_len,
+                sliding_window=sliding_window,
+                num_sink_tokens=num_sink_tokens,
+            )
             codes = torch.full((batch_size, 9, audio_seq_len), unknown_token)
 
         if audio_prefix_codes is not None:
@@ -252,64 +372,175 @@ class Zonos(nn.Module):
 
         delayed_prefix_audio_codes = delayed_codes[..., : prefix_audio_len + 1]
 
-        logits = self._prefill(prefix_conditioning, delayed_prefix_audio_codes, inference_params, cfg_scale)
-        next_token = sample_from_logits(logits, **sampling_params)
-
-        offset = delayed_prefix_audio_codes.shape[2]
-        frame = delayed_codes[..., offset : offset + 1]
-        frame.masked_scatter_(frame == unknown_token, next_token)
-
-        prefix_length = prefix_conditioning.shape[1] + prefix_audio_len + 1
-        inference_params.seqlen_offset += prefix_length
-        inference_params.lengths_per_sample[:] += prefix_length
-
-        logit_bias = torch.zeros_like(logits)
-        logit_bias[:, 1:, self.eos_token_id] = -torch.inf  # only allow codebook 0 to predict EOS
-
-        stopping = torch.zeros(batch_size, dtype=torch.bool, device=device)
-        max_steps = delayed_codes.shape[2] - offset
-        remaining_steps = torch.full((batch_size,), max_steps, device=device)
-        progress = tqdm(total=max_steps, desc="Generating", disable=not progress_bar)
-        cfg_scale = torch.tensor(cfg_scale)
-
         step = 0
-        while torch.max(remaining_steps) > 0:
-            offset += 1
-            input_ids = delayed_codes[..., offset - 1 : offset]
-            logits = decode_one_token(input_ids, inference_params, cfg_scale, allow_cudagraphs=cg)
-            logits += logit_bias
-
-            next_token = sample_from_logits(logits, generated_tokens=delayed_codes[..., :offset], **sampling_params)
-            eos_in_cb0 = next_token[:, 0] == self.eos_token_id
-
-            remaining_steps[eos_in_cb0[:, 0]] = torch.minimum(remaining_steps[eos_in_cb0[:, 0]], torch.tensor(9))
-            stopping |= eos_in_cb0[:, 0]
-
-            eos_codebook_idx = 9 - remaining_steps
-            eos_codebook_idx = torch.clamp(eos_codebook_idx, max=9 - 1)
-            for i in range(next_token.shape[0]):
-                if stopping[i]:
-                    idx = eos_codebook_idx[i].item()
-                    next_token[i, :idx] = self.masked_token_id
-                    next_token[i, idx] = self.eos_token_id
-
+        try:
+            if profiler is not None:
+                profiler.start()
+            with section("prefill"):
+                logits = self._prefill(prefix_conditioning, delayed_prefix_audio_codes, inference_params, cfg_scale)
+            sampling_workspace = SamplingWorkspace.like(logits)
+            next_token = sample_from_logits(
+                logits, workspace=sampling_workspace, generator=generator, **sampling_params
+            )
+            if timer is not None:
+                timer.mark("time_to_first_token")
+
+            offset = delayed_prefix_audio_codes.shape[2]
             frame = delayed_codes[..., offset : offset + 1]
             frame.masked_scatter_(frame == unknown_token, next_token)
-            inference_params.seqlen_offset += 1
-            inference_params.lengths_per_sample[:] += 1
-
-            remaining_steps -= 1
-
-            progress.update()
-            step += 1
 
-            if callback is not None and not callback(frame, step, max_steps):
-                break
+            repetition_window = RepetitionWindow.for_sampling_params(
+                sampling_params, batch_size, delayed_codes.shape[1], logits.shape[-1], device, logits.dtype
+            )
+            if repetition_window is not None:
+                repetition_window.push(delayed_codes[..., : offset + 1])
+
+            inference_params.seqlen_offset += prefix_length
+            inference_params.lengths_per_sample[:] += prefix_length
+
+            logit_bias = torch.zeros_like(logits)
+            logit_bias[:, 1:, self.eos_token_id] = -torch.inf  # only allow codebook 0 to predict EOS
+
+            stopping = torch.zeros(batch_size, dtype=torch.bool, device=device)
+            max_steps = delayed_codes.shape[2] - offset
+            remaining_steps = torch.full((batch_size,), max_steps, device=device)
+            progress = tqdm(total=max_steps, desc="Generating", disable=not progress_bar)
+            cfg_scale = torch.tensor(cfg_scale)
+
+            while torch.max(remaining_steps) > 0:
+                offset += 1
+                input_ids = delayed_codes[..., offset - 1 : offset]
+                with section("forward"):
+                    logits = decode_one_token(input_ids, inference_params, cfg_scale, allow_cudagraphs=cg)
+                    logits += logit_bias
+
+                with section("sampling"):
+                    next_token = sample_from_logits(
+                        logits,
+                        generated_tokens=delayed_codes[..., :offset],
+                        workspace=sampling_workspace,
+                        repetition_window=repetition_window,
+                        generator=generator,
+                        **sampling_params,
+                    )
+                eos_in_cb0 = next_token[:, 0] == self.eos_token_id
+
+                remaining_steps[eos_in_cb0[:, 0]] = torch.minimum(remaining_steps[eos_in_cb0[:, 0]], torch.tensor(9))
+                stopping |= eos_in_cb0[:, 0]
+
+                eos_codebook_idx = 9 - remaining_steps
+                eos_codebook_idx = torch.clamp(eos_codebook_idx, max=9 - 1)
+                for i in range(next_token.shape[0]):
+                    if stopping[i]:
+                        idx = eos_codebook_idx[i].item()
+                        next_token[i, :idx] = self.masked_token_id
+                        next_token[i, idx] = self.eos_token_id
+
+                frame = delayed_codes[..., offset : offset + 1]
+                frame.masked_scatter_(frame == unknown_token, next_token)
+                if repetition_window is not None:
+                    repetition_window.push(frame)
+                inference_params.seqlen_offset += 1
+                inference_params.lengths_per_sample[:] += 1
+
+                remaining_steps -= 1
+
+                progress.update()
+                step += 1
+                if profiler is not None:
+                    profiler.step()
+
+                if callback is not None and not callback(frame, step, max_steps):
+                    break
+        except BaseException:
+            # e.g. a callback raising to cancel: hand the cache back now rather than when the caller gives up.
+            self._cg_graph = None
+            self.release_cache(inference_params)
+            if profiler is not None:
+                profiler.close()
+            raise
 
         out_codes = revert_delay_pattern(delayed_codes)
-        out_codes.masked_fill_(out_codes >= 1024, 0)
         out_codes = out_codes[..., : offset - 9]
+        is_eos = out_codes[:, 0] == self.eos_token_id
+        lengths = torch.where(is_eos.any(dim=-1), is_eos.int().argmax(dim=-1), out_codes.shape[2])
+        out_codes.masked_fill_(out_codes >= 1024, 0)
+
+        if profiler is not None:
+            profiler.close()
+        if timer is not None:
+            timer.mark("total")
+            kv_bytes, kv_used_bytes = kv_cache_nbytes(inference_params)
+            instrumentation.record(
+                GenerationStats(
+                    batch_size=batch_size,
+                    prefix_length=prefix_length,
+                    steps=step,
+                    total_s=timer.marks["total"],
+                    prefill_s=timer.sections["prefill"][0],
+                    time_to_first_token_s=timer.marks["time_to_first_token"],
+                    step_s={k: v for k, v in timer.sections.items() if k != "prefill"},
+                    kv_cache_bytes=kv_bytes,
+                    kv_cache_used_bytes=kv_used_bytes,
+                    eos_steps=[
+                        n - prefix_audio_len if n < out_codes.shape[2] else None for n in lengths.tolist()
+                    ],
+                )
+            )
 
         self._cg_graph = None  # reset cuda graph to avoid cache changes
+        self.release_cache(inference_params)
 
+        if return_lengths:
+            return out_codes, lengths
         return out_codes
+
+    @torch.inference_mode()
+    def synthesize_long(
+        self,
+        text: str,
+        language: str = "en-us",
+        speaker: torch.Tensor | None = None,
+        max_phonemes_per_chunk: int = 150,
+        continue_previous: bool = True,
+        cond_kwargs: dict | None = None,
+        **generate_kwargs,
+    ) -> torch.Tensor:
+        """
+        Synthesize text of any length as one continuous waveform of shape [1, 1, num_samples].
+
+        The text is split into chunks of whole sentences within `max_phonemes_per_chunk`. With
+        `continue_previous`, each chunk after the first is generated as a continuation of the previous one: its
+        codes are the `audio_prefix_codes` and, since the model expects the prefix's transcript at the start of
+        the text, its text is prepended. A generation then covers up to two chunks, hence the small default
+        budget (~10s of speech per chunk). The conditioning of the next chunk (phonemization included) is
+        prepared on a worker thread while the current chunk decodes, and the codes of all chunks are decoded
+        together, so there are no seams.
+
+        `cond_kwargs` are forwarded to `make_cond_dict` and `generate_kwargs` to `generate`.
+        """
+        chunks = split_text_by_phonemes(text, language, max_phonemes_per_chunk)
+        if not chunks:
+            return torch.zeros(1, 1, 0)
+        cond_kwargs = dict(cond_kwargs or {}, language=language, speaker=speaker, device=self.device)
+        texts = continuation_texts(chunks) if continue_previous else chunks
+
+        def prepare(i: int) -> torch.Tensor:
+            with torch.inference_mode():
+                return self.prepare_conditioning(make_cond_dict(text=texts[i], **cond_kwargs))
+
+        all_codes = []
+        audio_prefix_codes = None
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(prepare, 0)
+            for i in range(len(chunks)):
+                conditioning = pending.result()
+                if i + 1 < len(chunks):
+                    pending = executor.submit(prepare, i + 1)
+
+                codes = self.generate(conditioning, audio_prefix_codes=audio_prefix_codes, **generate_kwargs)
+                prefix_len = 0 if audio_prefix_codes is None else audio_prefix_codes.shape[2]
+                all_codes.append(codes[..., prefix_len:])
+                audio_prefix_codes = all_codes[-1] if continue_previous else None
+
+        return self.autoencoder.decode(torch.cat(all_codes, dim=2))
@@ -0,0 +1,161 @@
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+import numpy as np
+import soundfile as sf
+import torch
+
+from zonos.conditioning import make_cond_dict
+from zonos.model import Zonos
+from zonos.sampling import make_generators
+
+_STOP = object()
+
+
+@dataclass
+class SynthesisRequest:
+    text: str
+    language: str = "en-us"
+    speaker: torch.Tensor | None = None
+    audio_prefix_codes: torch.Tensor | None = None
+    cond_kwargs: dict = field(default_factory=dict)  # forwarded to `make_cond_dict`
+    generate_kwargs: dict = field(default_factory=dict)  # forwarded to `Zonos.generate`
+    output_path: str | None = None  # written by the writer stage if set
+    seed: int | None = None  # makes the result reproducible
+    decode: bool = True  # False leaves `SynthesisResult.wav` None, for callers that keep the codes
+
+
+@dataclass
+class SynthesisResult:
+    request: SynthesisRequest
+    sampling_rate: int
+    wav: np.ndarray | None
+    codes: torch.Tensor
+
+
+class SynthesisPipeline:
+    """
+    Runs requests through four stages connected by bounded queues:
+
+        conditioning workers -> generation -> decode workers -> writer
+
+    Phonemization and conditioning (CPU) of upcoming requests, and DAC decode, the `.cpu()` copy and file writes
+    of finished ones, overlap with the autoregressive decode of the current request, which runs on a single
+    thread so the accelerator is never shared between two generate loops. The bounded queues apply backpressure
+    when one stage falls behind. Phonemization takes a process-wide lock (espeak isn't thread-safe), so extra
+    conditioning workers only overlap the rest of conditioning, such as speaker and prefix projections.
+
+    `submit` returns a `concurrent.futures.Future` resolving to a `SynthesisResult`.
+    """
+
+    def __init__(
+        self,
+        model: Zonos,
+        num_conditioning_workers: int = 1,
+        num_decode_workers: int = 1,
+        queue_size: int = 4,
+    ):
+        self.model = model
+        self._conditioning_queue = queue.Queue(maxsize=queue_size)
+        self._generation_queue = queue.Queue(maxsize=queue_size)
+        self._decode_queue = queue.Queue(maxsize=queue_size)
+        self._write_queue = queue.Queue(maxsize=queue_size)
+
+        self._stages = [
+            (self._conditioning_queue, self._conditioning_worker, num_conditioning_workers),
+            (self._generation_queue, self._generation_worker, 1),
+            (self._decode_queue, self._decode_worker, num_decode_workers),
+            (self._write_queue, self._write_worker, 1),
+        ]
+        self._stage_threads = []
+        for _, target, count in self._stages:
+            threads = [
+                threading.Thread(target=target, name=f"zonos-{target.__name__.strip('_')}-{i}", daemon=True)
+                for i in range(count)
+            ]
+            for thread in threads:
+                thread.start()
+            self._stage_threads.append(threads)
+        self._closed = False
+
+    def submit(self, request: SynthesisRequest) -> Future:
+        if self._closed:
+            raise RuntimeError("SynthesisPipeline is closed")
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self._conditioning_queue.put((request, future))
+        return future
+
+    def close(self):
+        """Finish all submitted requests, then stop the stage threads."""
+        if self._closed:
+            return
+        self._closed = True
+        # Stop stage by stage, so every stage has drained into the next before that one is told to stop.
+        for (stage_queue, _, _), threads in zip(self._stages, self._stage_threads):
+            for _ in threads:
+                stage_queue.put(_STOP)
+            for thread in threads:
+                thread.join()
+
+    def __enter__(self) -> "SynthesisPipeline":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run_stage(self, in_queue: queue.Queue, out_queue: queue.Queue | None, fn):
+        while (item := in_queue.get()) is not _STOP:
+            request, future, *payload = item
+            try:
+                output = fn(request, *payload)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            if out_queue is None:
+                future.set_result(output)
+            else:
+                out_queue.put((request, future, output))
+
+    def _conditioning_worker(self):
+        def prepare(request: SynthesisRequest) -> torch.Tensor:
+            with torch.inference_mode():
+                cond_dict = make_cond_dict(
+                    text=request.text,
+                    language=request.language,
+                    speaker=request.speaker,
+                    device=self.model.device,
+                    **request.cond_kwargs,
+                )
+                return self.model.prepare_conditioning(cond_dict)
+
+        self._run_stage(self._conditioning_queue, self._generation_queue, prepare)
+
+    def _generation_worker(self):
+        def generate(request: SynthesisRequest, conditioning: torch.Tensor) -> torch.Tensor:
+            generate_kwargs = dict(progress_bar=False) | request.generate_kwargs
+            if request.seed is not None:
+                generate_kwargs["generator"] = make_generators([request.seed], self.model.device)
+            return self.model.generate(conditioning, audio_prefix_codes=request.audio_prefix_codes, **generate_kwargs)
+
+        self._run_stage(self._generation_queue, self._decode_queue, generate)
+
+    def _decode_worker(self):
+        def decode(request: SynthesisRequest, codes: torch.Tensor) -> SynthesisResult:
+            if not request.decode:
+                return SynthesisResult(request, self.model.autoencoder.sampling_rate, None, codes.cpu())
+            with torch.inference_mode():
+                wav = self.model.autoencoder.decode(codes).cpu()
+            return SynthesisResult(request, self.model.autoencoder.sampling_rate, wav[0, 0].numpy(), codes.cpu())
+
+        self._run_stage(self._decode_queue, self._write_queue, decode)
+
+    def _write_worker(self):
+        def write(request: SynthesisRequest, result: SynthesisResult) -> SynthesisResult:
+            if request.output_path is not None and result.wav is not None:
+                sf.write(request.output_path, result.wav, result.sampling_rate)
+            return result
+
+        self._run_stage(self._write_queue, None, write)
@@ -0,0 +1,145 @@
+"""
+`torch.profiler` capture of a generation, for finding out why a particular request was slow.
+
+`Zonos.generate(..., profile=ProfileConfig("profiles"))` profiles the prefill and the first `num_steps` decode
+steps, then stops so long generations don't produce huge traces. Backbone layers and their direct children
+(`TransformerBlock`, `Attention`, `FeedForward`, or the Mamba equivalents) and the prefill, forward and sampling
+sections show up as labelled ranges. Traces are Chrome trace JSON: open them in chrome://tracing or Perfetto.
+
+With `memory_snapshot=True` a CUDA allocator snapshot (for https://pytorch.org/memory_viz) is written next to
+the trace, or on CPU a table of the ops that allocated the most memory.
+
+`profile_region(config, name)` profiles anything else the same way, e.g. the DAC decode.
+"""
+
+import os
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import dataclass
+
+import torch
+from torch.profiler import ProfilerActivity, record_function
+
+
+@dataclass
+class ProfileConfig:
+    output_dir: str = "profiles"
+    num_steps: int = 32  # decode steps captured after the prefill
+    record_shapes: bool = True
+    with_stack: bool = False
+    memory_snapshot: bool = False
+    max_snapshot_entries: int = 100_000
+
+
+class _Capture:
+    def __init__(self, config: ProfileConfig, name: str):
+        self.config = config
+        self.name = name
+        self._cuda = torch.cuda.is_available()
+        self._profiler = None
+
+    def start(self):
+        config = self.config
+        if config.memory_snapshot and self._cuda:
+            torch.cuda.memory._record_memory_history(max_entries=config.max_snapshot_entries)
+        activities = [ProfilerActivity.CPU] + ([ProfilerActivity.CUDA] if self._cuda else [])
+        self._profiler = torch.profiler.profile(
+            activities=activities,
+            record_shapes=config.record_shapes,
+            profile_memory=True,
+            with_stack=config.with_stack,
+        )
+        self._profiler.__enter__()
+
+    def stop(self):
+        self._profiler.__exit__(None, None, None)
+        os.makedirs(self.config.output_dir, exist_ok=True)
+        stem = os.path.join(self.config.output_dir, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}")
+        self._profiler.export_chrome_trace(f"{stem}.json")
+        print(f"Wrote profiler trace to {stem}.json")
+
+        if self.config.memory_snapshot:
+            if self._cuda:
+                torch.cuda.memory._dump_snapshot(f"{stem}-memory.pickle")
+                torch.cuda.memory._record_memory_history(enabled=None)
+                print(f"Wrote CUDA memory snapshot to {stem}-memory.pickle")
+            else:
+                table = self._profiler.key_averages().table(sort_by="self_cpu_memory_usage", row_limit=50)
+                with open(f"{stem}-memory.txt", "w") as f:
+                    f.write(table)
+                print(f"Wrote CPU memory table to {stem}-memory.txt")
+
+
+@contextmanager
+def profile_region(config: ProfileConfig | None, name: str):
+    """Profile the body of the `with` block into its own trace; does nothing if `config` is None."""
+    if config is None:
+        yield
+        return
+    capture = _Capture(config, name)
+    capture.start()
+    try:
+        with record_function(f"zonos::{name}"):
+            yield
+    finally:
+        capture.stop()
+
+
+class GenerationProfiler:
+    """Used by `Zonos.generate`: `start` before the prefill, `step` after every decode step, `close` at the end."""
+
+    def __init__(self, model: torch.nn.Module, config: ProfileConfig):
+        self.model = model
+        self.config = config
+        self.steps = 0
+        self._capture = _Capture(config, "generate")
+        self._hooks = []
+        self._open_ranges = []
+        self.active = False
+
+    def start(self):
+        for i, layer in enumerate(self.model.backbone.layers):
+            for module in (layer, *layer.children()):
+                self._label_module(module, f"{type(module).__name__}[{i}]")
+        self._capture.start()
+        self.active = True
+
+    def step(self):
+        self.steps += 1
+        if self.steps >= self.config.num_steps:
+            self.close()
+
+    def close(self):
+        if not self.active:
+            return
+        self.active = False
+        for hook in self._hooks:
+            hook.remove()
+        self._hooks.clear()
+        self._capture.stop()
+
+    def label(self, name: str):
+        return record_function(f"zonos::{name}") if self.active else nullcontext()
+
+    def wrap_section(self, section):
+        """Label `section(name)` blocks (e.g. instrumentation timings) in the trace as well."""
+
+        def labelled(name: str):
+            stack = ExitStack()
+            stack.enter_context(self.label(name))
+            stack.enter_context(section(name))
+            return stack
+
+        return labelled
+
+    def _label_module(self, module: torch.nn.Module, name: str):
+        def enter(module, args):
+            label = record_function(name)
+            label.__enter__()
+            self._open_ranges.append(label)
+
+        def leave(module, args, output):
+            self._open_ranges.pop().__exit__(None, None, None)
+
+        self._hooks.append(module.register_forward_pre_hook(enter))
+        self._hooks.append(module.register_forward_hook(leave))
@@ -0,0 +1,176 @@
+import os
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+import torch
+
+from zonos.autoencoder import DACAutoencoder
+from zonos.model import Zonos
+from zonos.utils import DEFAULT_DEVICE
+
+
+def model_nbytes(model: torch.nn.Module) -> int:
+    return sum(t.numel() * t.element_size() for t in [*model.parameters(), *model.buffers()])
+
+
+class ModelRegistry:
+    """Keeps several `Zonos` models loaded so switching between them doesn't cost a cold load.
+
+    `get` returns the requested model on `device`, loading it on first use. Models are tracked in least recently
+    used order; when the models on `device` exceed `memory_budget_bytes`, the least recently used ones are moved
+    to CPU memory (`offload_to_cpu=True`) or dropped. Offloaded models come back with a host-to-device copy
+    instead of a load from disk. `max_models` bounds how many models are kept at all, offloaded ones included.
+
+    A model obtained through `lease` (or `acquire`/`release`) stays on `device` until it is given back: only idle
+    models are offloaded or dropped, so one caller can't pull a model out from under another one's `generate`.
+
+    All models share one `DACAutoencoder`, which stays on `device`.
+    """
+
+    def __init__(
+        self,
+        device: str | torch.device = DEFAULT_DEVICE,
+        memory_budget_bytes: int | None = None,
+        offload_to_cpu: bool = True,
+        max_models: int | None = None,
+        loader: Callable[..., Zonos] = Zonos.from_pretrained,
+    ):
+        self.device = torch.device(device)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.offload_to_cpu = offload_to_cpu and self.device.type != "cpu"
+        self.max_models = max_models
+        self._loader = loader
+        self._autoencoder: DACAutoencoder | None = None
+        self._models: OrderedDict[str, Zonos] = OrderedDict()
+        self._leases: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, device: str | torch.device = DEFAULT_DEVICE, **kwargs) -> "ModelRegistry":
+        """Registry whose memory budget comes from `ZONOS_MODEL_MEMORY_GB`; without it every model stays loaded."""
+        memory_gb = os.getenv("ZONOS_MODEL_MEMORY_GB")
+        kwargs.setdefault("memory_budget_bytes", int(float(memory_gb) * 2**30) if memory_gb else None)
+        return cls(device, **kwargs)
+
+    @property
+    def autoencoder(self) -> DACAutoencoder:
+        if self._autoencoder is None:
+            self._autoencoder = DACAutoencoder()
+            self._autoencoder.dac.to(self.device)
+        return self._autoencoder
+
+    def get(self, model_id: str) -> Zonos:
+        """The model on `device`, loading it on first use. It may be offloaded again by a later call; use `lease` to
+        keep it in place while running it."""
+        with self._lock:
+            return self._get(model_id)
+
+    def acquire(self, model_id: str) -> Zonos:
+        """Like `get`, but the model isn't offloaded or dropped until a matching `release`."""
+        with self._lock:
+            self._leases[model_id] += 1
+            try:
+                return self._get(model_id)
+            except BaseException:
+                self._return(model_id)
+                raise
+
+    def release(self, model_id: str):
+        with self._lock:
+            self._return(model_id)
+            self._enforce_budget()
+
+    @contextmanager
+    def lease(self, model_id: str) -> Iterator[Zonos]:
+        model = self.acquire(model_id)
+        try:
+            yield model
+        finally:
+            self.release(model_id)
+
+    def _get(self, model_id: str) -> Zonos:
+        model = self._models.get(model_id)
+        if model is None:
+            print(f"Loading {model_id} model...")
+            model = self._loader(model_id, device=self.device, autoencoder=self.autoencoder)
+            model.requires_grad_(False).eval()
+            self._models[model_id] = model
+            print(f"{model_id} model loaded successfully!")
+        elif not self._is_on_device(model):
+            print(f"Restoring {model_id} model from CPU...")
+            model.to(self.device)
+        self._models.move_to_end(model_id)
+        self._enforce_budget()
+        return model
+
+    def _return(self, model_id: str):
+        self._leases[model_id] -= 1
+        if self._leases[model_id] <= 0:
+            del self._leases[model_id]
+
+    def resident(self) -> dict[str, torch.device]:
+        """Device of every model currently kept, least recently used first."""
+        with self._lock:
+            return {model_id: model.device for model_id, model in self._models.items()}
+
+    def evict(self, model_id: str):
+        """Drop `model_id` unless it is leased."""
+        with self._lock:
+            if model_id not in self._leases:
+                self._drop(model_id)
+
+    def clear(self):
+        """Drop every model that isn't leased."""
+        with self._lock:
+            for model_id in list(self._models):
+                if model_id not in self._leases:
+                    self._drop(model_id)
+
+    def _is_on_device(self, model: Zonos) -> bool:
+        # Compare types only: `cuda` and `cuda:0` are the same place here, and offloading always goes to CPU.
+        return model.device.type == self.device.type
+
+    def _on_device(self) -> list[str]:
+        return [model_id for model_id, model in self._models.items() if self._is_on_device(model)]
+
+    def _enforce_budget(self):
+        # The most recently used model is never evicted, even if it alone exceeds the budget, and neither are leased
+        # ones; `release` enforces the budget again once they are idle.
+        if self.memory_budget_bytes is not None:
+            on_device = self._on_device()
+            used = sum(model_nbytes(self._models[model_id]) for model_id in on_device)
+            for model_id in on_device[:-1]:
+                if used <= self.memory_budget_bytes:
+                    break
+                if model_id in self._leases:
+                    continue
+                used -= model_nbytes(self._models[model_id])
+                if self.offload_to_cpu:
+                    self._offload(model_id)
+                else:
+                    self._drop(model_id)
+
+        if self.max_models is not None:
+            idle = [model_id for model_id in list(self._models)[:-1] if model_id not in self._leases]
+            for model_id in idle[: max(len(self._models) - max(self.max_models, 1), 0)]:
+                self._drop(model_id)
+
+    def _offload(self, model_id: str):
+        model = self._models[model_id]
+        model.inference_pool.clear()
+        model._cg_graph = None
+        model.to("cpu")
+        self._empty_cache()
+
+    def _drop(self, model_id: str):
+        model = self._models.pop(model_id, None)
+        if model is not None:
+            model.inference_pool.clear()
+            del model
+            self._empty_cache()
+
+    def _empty_cache(self):
+        if self.device.type == "cuda":
+            torch.cuda.empty_cache()
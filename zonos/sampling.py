@@ -1,5 +1,12 @@
+import inspect
+import math
+from dataclasses import dataclass
+
 import torch
 
+# Same floor as `apply_unified`'s `probs.clamp_min(1e-20)`, expressed in log space.
+_LOGPROB_FLOOR = math.log(1e-20)
+
 
 def multinomial(input: torch.Tensor, num_samples: int, replacement=False, *, generator=None):
     """torch.multinomial with arbitrary number of dimensions, and number of candidates on the last dimension.
@@ -114,7 +121,382 @@ def modify_logit_for_repetition_penalty(
     return torch.where(logits <= 0, logits * factors, logits / factors)
 
 
+def _penalize_tokens_(logits: torch.Tensor, tokens: torch.Tensor, repetition_penalty: float | torch.Tensor):
+    # One window position at a time, so tokens repeated within the window compound to penalty ** count.
+    for i in range(tokens.shape[-1]):
+        idx = tokens[..., i : i + 1]
+        selected = logits.gather(-1, idx)
+        penalized = torch.where(selected <= 0, selected * repetition_penalty, selected / repetition_penalty)
+        logits.scatter_(-1, idx, penalized)
+    return logits
+
+
+def modify_logit_for_repetition_penalty_(
+    logits: torch.Tensor,
+    generated_tokens: torch.Tensor,
+    repetition_penalty: float | torch.Tensor,
+    repetition_penalty_window: int,
+) -> torch.Tensor:
+    """In-place variant of `modify_logit_for_repetition_penalty`.
+
+    Only the logits of the (at most `repetition_penalty_window`) recent tokens are touched, so repeated tokens
+    compound to `repetition_penalty ** count` just like the scatter-reduce version, at O(window) cost.
+    `repetition_penalty` may be a per-row tensor broadcastable to (batch_size, 1, 1).
+    """
+    generated_tokens = generated_tokens[..., -repetition_penalty_window:]
+    generated_tokens = generated_tokens.clamp_max(logits.shape[-1] - 1).to(torch.int64)
+    return _penalize_tokens_(logits, generated_tokens, repetition_penalty)
+
+
+@dataclass
+class RepetitionWindow:
+    """Ring buffer of the last `repetition_penalty_window` tokens of every row and codebook.
+
+    Maintained by the decode loop via `push`, so the repetition penalty reads a fixed-size buffer instead of
+    slicing, clamping and casting the generated history on every step. Order within the window is irrelevant
+    to the penalty, so the buffer is never rotated. The penalty's factors and the scratch `penalize_` works in
+    are set up once as well, so applying it allocates nothing. A window <= 0 penalizes the whole history, which
+    `for_sampling_params` hands to `RepetitionCounts` instead.
+    """
+
+    tokens: torch.Tensor  # [batch_size, n_codebooks, window], int64, clamped to the vocab
+    vocab_size: int
+    penalty: torch.Tensor  # [batch_size, 1, 1], applied to logits <= 0
+    inv_penalty: torch.Tensor  # [batch_size, 1, 1], applied to logits > 0
+    selected: torch.Tensor  # [batch_size, n_codebooks, 1] scratch, in the logits' dtype
+    factor: torch.Tensor  # same
+    non_positive: torch.Tensor  # [batch_size, n_codebooks, 1] scratch, bool
+    position: int = 0
+    filled: int = 0
+
+    @classmethod
+    def for_sampling_params(
+        cls,
+        sampling_params: dict,
+        batch_size: int,
+        n_codebooks: int,
+        vocab_size: int,
+        device: torch.device,
+        dtype: torch.dtype = torch.float32,
+    ) -> "RepetitionWindow | RepetitionCounts | None":
+        defaults = inspect.signature(sample_from_logits).parameters
+        window = sampling_params.get("repetition_penalty_window", defaults["repetition_penalty_window"].default)
+        penalty = sampling_params.get("repetition_penalty", defaults["repetition_penalty"].default)
+        if not isinstance(penalty, torch.Tensor) and penalty == 1.0:
+            return None
+        penalty = torch.as_tensor(penalty, dtype=dtype, device=device).expand(batch_size).reshape(-1, 1, 1)
+        if window <= 0:
+            return RepetitionCounts.for_penalty(penalty, n_codebooks, vocab_size)
+        return cls(
+            tokens=torch.zeros(batch_size, n_codebooks, window, dtype=torch.int64, device=device),
+            vocab_size=vocab_size,
+            penalty=penalty,
+            inv_penalty=penalty.reciprocal(),
+            selected=torch.empty(batch_size, n_codebooks, 1, dtype=dtype, device=device),
+            factor=torch.empty(batch_size, n_codebooks, 1, dtype=dtype, device=device),
+            non_positive=torch.empty(batch_size, n_codebooks, 1, dtype=torch.bool, device=device),
+        )
+
+    @property
+    def recent(self) -> torch.Tensor:
+        return self.tokens[..., : self.filled]
+
+    def push(self, tokens: torch.Tensor):
+        """Append tokens of shape [batch_size, n_codebooks, n], oldest first."""
+        window = self.tokens.shape[-1]
+        for i in range(max(tokens.shape[-1] - window, 0), tokens.shape[-1]):
+            self.tokens[..., self.position].copy_(tokens[..., i]).clamp_max_(self.vocab_size - 1)
+            self.position = (self.position + 1) % window
+            self.filled = min(self.filled + 1, window)
+
+    def penalize_(self, logits: torch.Tensor) -> torch.Tensor:
+        """Same as `_penalize_tokens_(logits, self.recent, penalty)`, in the preallocated buffers."""
+        for i in range(self.filled):
+            idx = self.tokens[..., i : i + 1]
+            torch.gather(logits, -1, idx, out=self.selected)
+            torch.le(self.selected, 0, out=self.non_positive)
+            torch.where(self.non_positive, self.penalty, self.inv_penalty, out=self.factor)
+            logits.scatter_(-1, idx, self.selected.mul_(self.factor))
+        return logits
+
+
+@dataclass
+class RepetitionCounts:
+    """Repetition penalty over the whole generated history (`repetition_penalty_window <= 0`).
+
+    Keeps `penalty ** count` and its reciprocal for every row, codebook and token, updated by `push` as tokens are
+    generated, so applying the penalty costs O(vocab_size) per step however long the history grows.
+    """
+
+    vocab_size: int
+    penalty: torch.Tensor  # [batch_size, 1, 1]
+    inv_penalty: torch.Tensor  # [batch_size, 1, 1]
+    factor: torch.Tensor  # [batch_size, n_codebooks, vocab_size], penalty ** count, applied to logits <= 0
+    inv_factor: torch.Tensor  # same, applied to logits > 0
+    selected: torch.Tensor  # [batch_size, n_codebooks, 1] scratch
+    index: torch.Tensor  # [batch_size, n_codebooks, 1] scratch, int64
+    scale: torch.Tensor  # [batch_size, n_codebooks, vocab_size] scratch
+    non_positive: torch.Tensor  # [batch_size, n_codebooks, vocab_size] scratch, bool
+
+    @classmethod
+    def for_penalty(cls, penalty: torch.Tensor, n_codebooks: int, vocab_size: int) -> "RepetitionCounts":
+        batch_size, dtype, device = penalty.shape[0], penalty.dtype, penalty.device
+        return cls(
+            vocab_size=vocab_size,
+            penalty=penalty,
+            inv_penalty=penalty.reciprocal(),
+            factor=torch.ones(batch_size, n_codebooks, vocab_size, dtype=dtype, device=device),
+            inv_factor=torch.ones(batch_size, n_codebooks, vocab_size, dtype=dtype, device=device),
+            selected=torch.empty(batch_size, n_codebooks, 1, dtype=dtype, device=device),
+            index=torch.empty(batch_size, n_codebooks, 1, dtype=torch.int64, device=device),
+            scale=torch.empty(batch_size, n_codebooks, vocab_size, dtype=dtype, device=device),
+            non_positive=torch.empty(batch_size, n_codebooks, vocab_size, dtype=torch.bool, device=device),
+        )
+
+    def push(self, tokens: torch.Tensor):
+        """Count tokens of shape [batch_size, n_codebooks, n]."""
+        for i in range(tokens.shape[-1]):
+            torch.clamp_max(tokens[..., i : i + 1], self.vocab_size - 1, out=self.index)
+            for factor, penalty in ((self.factor, self.penalty), (self.inv_factor, self.inv_penalty)):
+                torch.gather(factor, -1, self.index, out=self.selected)
+                factor.scatter_(-1, self.index, self.selected.mul_(penalty))
+
+    def penalize_(self, logits: torch.Tensor) -> torch.Tensor:
+        """Same as `_penalize_tokens_` over every pushed token, in the preallocated buffers."""
+        torch.le(logits, 0, out=self.non_positive)
+        torch.where(self.non_positive, self.factor, self.inv_factor, out=self.scale)
+        return logits.mul_(self.scale)
+
+
+def make_generators(seeds: list[int], device: torch.device | str) -> list[torch.Generator]:
+    """One seeded generator per batch row, for use as `sample_from_logits(..., generator=...)`."""
+    return [torch.Generator(device=device).manual_seed(int(seed)) for seed in seeds]
+
+
+def _exponential_(
+    noise: torch.Tensor, generator: torch.Generator | list[torch.Generator] | None = None
+) -> torch.Tensor:
+    if isinstance(generator, (list, tuple)):
+        assert len(generator) == noise.shape[0], "Expected one generator per batch row"
+        for row, row_generator in zip(noise, generator):
+            row.exponential_(1, generator=row_generator)
+        return noise
+    return noise.exponential_(1, generator=generator)
+
+
+@dataclass
+class SamplingWorkspace:
+    """Scratch buffers for `sample_from_logits`, allocated once and reused across decode steps."""
+
+    logits: torch.Tensor
+    probs: torch.Tensor
+    noise: torch.Tensor
+    mask: torch.Tensor
+    sorted_probs: torch.Tensor
+    sorted_idx: torch.Tensor
+    sorted_mask: torch.Tensor
+
+    @classmethod
+    def like(cls, logits: torch.Tensor) -> "SamplingWorkspace":
+        return cls(
+            logits=torch.empty_like(logits),
+            probs=torch.empty_like(logits),
+            noise=torch.empty_like(logits),
+            mask=torch.empty_like(logits, dtype=torch.bool),
+            sorted_probs=torch.empty_like(logits),
+            sorted_idx=torch.empty_like(logits, dtype=torch.int64),
+            sorted_mask=torch.empty_like(logits, dtype=torch.bool),
+        )
+
+    def matches(self, logits: torch.Tensor) -> bool:
+        return (
+            self.logits.shape == logits.shape
+            and self.logits.dtype == logits.dtype
+            and self.logits.device == logits.device
+        )
+
+
+def _row_param(value: float | torch.Tensor, logits: torch.Tensor) -> float | torch.Tensor:
+    """Scalars pass through; per-row tensors become [batch_size, 1, 1] to broadcast over codebooks and vocab."""
+    if isinstance(value, torch.Tensor):
+        dtype = value.dtype if not value.is_floating_point() else logits.dtype
+        return value.to(logits.device, dtype).view(-1, 1, 1)
+    return value
+
+
+def _enabled(value: float | torch.Tensor) -> bool:
+    if isinstance(value, torch.Tensor):
+        return bool((value > 0).any())
+    return value > 0
+
+
+def _apply_unified_(
+    logits: torch.Tensor,
+    ws: SamplingWorkspace,
+    linear: float | torch.Tensor,
+    conf: float | torch.Tensor,
+    quad: float | torch.Tensor,
+):
+    if isinstance(linear, torch.Tensor):
+        ws.sorted_probs.copy_(logits)  # rows with linear <= 0 are restored from here afterwards
+
+    # logits -> clamped logprobs, then the same polynomial as `apply_unified`, kept as unnormalized logits.
+    logits.sub_(torch.logsumexp(logits, dim=-1, keepdim=True)).clamp_min_(_LOGPROB_FLOOR)
+    entropy = torch.exp(logits, out=ws.probs).mul_(logits).sum(dim=-1, keepdim=True).neg_()
+    torch.mul(logits, logits, out=ws.probs).mul_(quad)
+    logits.mul_(entropy.mul_(conf).add_(linear)).sub_(ws.probs)
+
+    if isinstance(linear, torch.Tensor):
+        torch.where(linear > 0, logits, ws.sorted_probs, out=logits)
+
+
+def _apply_top_p_(logits: torch.Tensor, ws: SamplingWorkspace, p: float | torch.Tensor):
+    ws.probs.copy_(logits).sub_(logits.amax(dim=-1, keepdim=True)).exp_()
+    ws.probs.div_(ws.probs.sum(dim=-1, keepdim=True))
+    torch.sort(ws.probs, dim=-1, descending=True, out=(ws.sorted_probs, ws.sorted_idx))
+    torch.cumsum(ws.sorted_probs, dim=-1, out=ws.probs)
+    torch.gt(ws.probs.sub_(ws.sorted_probs), p, out=ws.sorted_mask)
+    if isinstance(p, torch.Tensor):
+        ws.sorted_mask.logical_and_(p > 0)
+    ws.mask.scatter_(-1, ws.sorted_idx, ws.sorted_mask)
+    logits.masked_fill_(ws.mask, -torch.inf)
+
+
+def _apply_top_k_(logits: torch.Tensor, ws: SamplingWorkspace, k: int | torch.Tensor):
+    if isinstance(k, torch.Tensor):
+        max_k = min(int(k.max()), logits.size(-1))
+        values = torch.topk(logits, max_k, dim=-1).values
+        kth = (k.clamp(1, max_k) - 1).to(torch.int64).expand(*logits.shape[:-1], 1)
+        pivot = values.gather(-1, kth).masked_fill_(k <= 0, -torch.inf)
+    else:
+        pivot = torch.topk(logits, min(k, logits.size(-1)), dim=-1).values[..., -1:]
+    logits.masked_fill_(torch.lt(logits, pivot, out=ws.mask), -torch.inf)
+
+
+def _apply_min_p_(logits: torch.Tensor, ws: SamplingWorkspace, min_p: float | torch.Tensor):
+    # probs < min_p * max(probs)  <=>  logits < max(logits) + log(min_p); min_p == 0 gives -inf and removes nothing.
+    log_min_p = torch.log(min_p) if isinstance(min_p, torch.Tensor) else math.log(min_p)
+    threshold = logits.amax(dim=-1, keepdim=True).add_(log_min_p)
+    logits.masked_fill_(torch.lt(logits, threshold, out=ws.mask), -torch.inf)
+
+
 def sample_from_logits(
+    logits: torch.Tensor,
+    temperature: float | torch.Tensor = 1.0,
+    top_p: float | torch.Tensor = 0.0,
+    top_k: int | torch.Tensor = 0,
+    min_p: float | torch.Tensor = 0.0,
+    linear: float | torch.Tensor = 0.0,
+    conf: float | torch.Tensor = 0.0,
+    quad: float | torch.Tensor = 0.0,
+    generated_tokens: torch.Tensor | None = None,
+    repetition_penalty: float | torch.Tensor = 3.0,
+    repetition_penalty_window: int = 2,
+    workspace: SamplingWorkspace | None = None,
+    generator: torch.Generator | list[torch.Generator] | None = None,
+    repetition_window: RepetitionWindow | RepetitionCounts | None = None,
+) -> torch.Tensor:
+    """Sample next token from logits using either top_k/p/min_p OR using NovelAI's Unified Sampler.
+
+    Fused equivalent of `sample_from_logits_unfused`: every filter is applied in place in logit space on a single
+    copy of `logits` (held in `workspace`), and sampling uses the Gumbel/exponential trick directly on the filtered
+    logits, so no intermediate distributions are materialized. `logits` itself is never modified.
+
+    Every sampling parameter except `repetition_penalty_window` may also be a tensor with one value per batch row
+    (see `collate_sampling_params`), so requests with different settings can share a batch. A row's filter is
+    disabled by the same value that disables it globally, e.g. `top_k=0` or `linear=0`; `temperature=0` makes
+    that row greedy.
+
+    Args:
+        logits (torch.Tensor): Input logits with token candidates on the last dimension.
+        workspace (SamplingWorkspace): Preallocated scratch buffers matching `logits`. Pass the same workspace on
+            every decode step so no vocab-sized buffer is allocated per step; `logsumexp`, `amax` and `topk` still
+            allocate their small per-row results. A temporary workspace is created if omitted.
+        generator (torch.Generator | list[torch.Generator]): Source of randomness. A list holds one generator per
+            batch row, so each row's draws depend only on its own generator and not on the rest of the batch.
+        repetition_window (RepetitionWindow | RepetitionCounts): Recent tokens kept by the caller's decode loop,
+            along with the penalty it was made for. Used instead of `generated_tokens`, `repetition_penalty` and
+            `repetition_penalty_window` when given.
+
+        See `sample_from_logits_unfused` for the remaining sampling parameters.
+
+    Returns:
+        torch.Tensor: Sampled tokens.
+    """
+    if workspace is None or not workspace.matches(logits):
+        workspace = SamplingWorkspace.like(logits)
+    ws = workspace
+    logits = ws.logits.copy_(logits)
+    temperature, top_p, top_k, min_p, linear, conf, quad, repetition_penalty = (
+        _row_param(v, logits) for v in (temperature, top_p, top_k, min_p, linear, conf, quad, repetition_penalty)
+    )
+
+    if repetition_window is not None:
+        repetition_window.penalize_(logits)
+    elif generated_tokens is not None and (isinstance(repetition_penalty, torch.Tensor) or repetition_penalty != 1.0):
+        modify_logit_for_repetition_penalty_(logits, generated_tokens, repetition_penalty, repetition_penalty_window)
+
+    greedy_tokens = None
+    if isinstance(temperature, torch.Tensor):
+        greedy = temperature <= 0
+        if greedy.all():
+            return torch.argmax(logits, dim=-1, keepdim=True)
+        if greedy.any():
+            greedy_tokens = torch.argmax(logits, dim=-1, keepdim=True)
+        logits.div_(torch.where(greedy, 1.0, temperature))
+    elif temperature <= 0:
+        return torch.argmax(logits, dim=-1, keepdim=True)
+    else:
+        logits.div_(temperature)
+
+    if _enabled(linear):
+        _apply_unified_(logits, ws, linear, conf, quad)
+    if _enabled(top_p):
+        _apply_top_p_(logits, ws, top_p)
+    if _enabled(top_k):
+        _apply_top_k_(logits, ws, top_k)
+    if _enabled(min_p):
+        _apply_min_p_(logits, ws, min_p)
+
+    # argmax(probs / q) with q ~ Exp(1), as in `multinomial`, is argmax(logits - log(q)).
+    logits.sub_(_exponential_(ws.noise, generator).log_())
+    next_token = torch.argmax(logits, dim=-1, keepdim=True)
+    if greedy_tokens is not None:
+        next_token = torch.where(greedy, greedy_tokens, next_token)
+    return next_token  # [batch_size, num_codebooks, 1]
+
+
+_ROW_SAMPLING_PARAMS = ("temperature", "top_p", "top_k", "min_p", "linear", "conf", "quad", "repetition_penalty")
+
+
+def collate_sampling_params(params: list[dict], device: torch.device | str | None = None) -> dict:
+    """Merge one `sampling_params` dict per batch row into kwargs for `sample_from_logits`.
+
+    Parameters that agree across rows stay Python scalars (keeping the scalar fast path); the others become
+    per-row tensors. `repetition_penalty_window` must be the same for every row.
+    """
+    defaults = inspect.signature(sample_from_logits).parameters
+    unknown = set().union(*params) - {*_ROW_SAMPLING_PARAMS, "repetition_penalty_window"}
+    if unknown:
+        raise ValueError(f"Unsupported per-row sampling parameters: {sorted(unknown)}")
+
+    collated = {}
+    for name in _ROW_SAMPLING_PARAMS:
+        values = [p.get(name, defaults[name].default) for p in params]
+        if all(v == values[0] for v in values):
+            collated[name] = values[0]
+        else:
+            dtype = torch.int64 if name == "top_k" else torch.float32
+            collated[name] = torch.tensor(values, dtype=dtype, device=device)
+
+    windows = {p.get("repetition_penalty_window", defaults["repetition_penalty_window"].default) for p in params}
+    if len(windows) > 1:
+        raise ValueError(f"repetition_penalty_window must be shared by all rows, got {sorted(windows)}")
+    collated["repetition_penalty_window"] = windows.pop()
+    return collated
+
+
+def sample_from_logits_unfused(
     logits: torch.Tensor,
     temperature: float = 1.0,
     top_p: float = 0.0,
@@ -126,9 +508,13 @@ def sample_from_logits(
     generated_tokens: torch.Tensor | None = None,
     repetition_penalty: float = 3.0,
     repetition_penalty_window: int = 2,
+    generator: torch.Generator | None = None,
 ) -> torch.Tensor:
     """Sample next token from logits using either top_k/p/min_p OR using NovelAI's Unified Sampler.
-    
+
+    This is the original chain of `apply_*` helpers, each materializing a new distribution. It is kept as the
+    reference for `sample_from_logits`, which computes the same thing in a single in-place pass.
+
     Args:
         logits (torch.Tensor): Input logits with token candidates on the last dimension.
 
@@ -158,6 +544,8 @@ def sample_from_logits(
 
         quad (float): Quadratic - High values make low probablities much lower. -> -2.0 to 2.0, default from gradio 0.0
 
+        generator (torch.Generator): A pseudorandom number generator for sampling.
+
     Returns:
         torch.Tensor: Sampled tokens.
     """
@@ -175,7 +563,7 @@ def sample_from_logits(
         if min_p > 0:
             probs = apply_min_p(probs, min_p)
 
-        next_token = multinomial(probs, num_samples=1)
+        next_token = multinomial(probs, num_samples=1, generator=generator)
     else:
         next_token = torch.argmax(logits, dim=-1, keepdim=True)
 
@@ -0,0 +1,481 @@
+"""
+Headless HTTP inference server.
+
+Endpoints:
+
+    GET  /health          -> {"status": "ok", "queued": <admitted requests not yet batched>}
+    GET  /metrics         -> Prometheus text, if `model.instrumentation` has a `PrometheusSink`
+    POST /synthesize      JSON request -> audio/wav
+    POST /stream          JSON request -> chunked raw PCM (s16le, mono, rate in X-Sample-Rate), one chunk of
+                          audio per group of sentences, each generated as a continuation of the previous one
+                          (see `Zonos.synthesize_long`)
+    POST /embed_speaker   audio file bytes (any format soundfile reads) -> {"embedding": [...]}
+
+Synthesis requests are JSON objects:
+
+    {
+        "text": "Hello world.",
+        "language": "en-us",
+        "speaker": [...],             # optional, from /embed_speaker
+        "seed": 421,                  # optional
+        "cfg_scale": 2.0,
+        "max_new_tokens": 2580,
+        "sampling_params": {"min_p": 0.1},
+        "conditioning": {...}         # forwarded to `make_cond_dict`, e.g. emotion, speaking_rate, pitch_std
+    }
+
+Requests are admitted into a bounded queue (503 when it is full) and collected by a single batcher into
+micro-batches of compatible requests, each of which is one `Zonos.generate` call with per-row sampling params
+and generators. Only requests with the same number of phonemes share a call, so a seeded request gives the same
+audio whatever else arrived with it. Generation runs on a single worker thread, so the event loop keeps accepting connections
+while the model is busy. Every generation is bounded by `request_timeout_s` (504 on expiry).
+
+Usage:
+    python -m zonos.server --model Zyphra/Zonos-v0.1-transformer --port 8000
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import soundfile as sf
+import torch
+
+from zonos.async_generate import CancellationToken, GenerationCancelled
+from zonos.conditioning import continuation_texts, make_cond_dict, split_text_by_phonemes
+from zonos.instrumentation import Instrumentation, PrometheusSink
+from zonos.model import Zonos
+from zonos.sampling import collate_sampling_params, make_generators
+from zonos.utils import DEFAULT_DEVICE
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+@dataclass
+class ServerConfig:
+    host: str = "127.0.0.1"
+    port: int = 8000
+    max_batch_size: int = 4
+    max_batch_wait_ms: float = 20.0  # how long the batcher waits for more requests after the first one arrives
+    max_queue_size: int = 32  # admitted but not yet batched requests; beyond this new requests get a 503
+    request_timeout_s: float = 120.0  # per generate call, queueing included
+    max_body_bytes: int = 16 * 2**20
+    max_new_tokens: int = 86 * 30  # upper bound on what a request may ask for
+    stream_max_phonemes: int = 150  # per chunk; a chunk is generated together with the previous one
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class _Job:
+    cond_dict: dict
+    seed: int
+    sampling_params: dict
+    repetition_penalty_window: int  # can't differ within a batch
+    cfg_scale: float
+    max_new_tokens: int
+    audio_prefix_codes: torch.Tensor | None
+    future: asyncio.Future = field(repr=False)
+    cancel_token: CancellationToken = field(default_factory=CancellationToken, repr=False)  # set on timeout
+
+    @property
+    def batch_key(self) -> tuple:
+        """Jobs with equal keys can share a `generate` call."""
+        cond_layout = tuple(sorted((k, v is None) for k, v in self.cond_dict.items() if k != "espeak"))
+        prefix_len = None if self.audio_prefix_codes is None else self.audio_prefix_codes.shape[2]
+        return cond_layout, self.cfg_scale, self.max_new_tokens, prefix_len, self.repetition_penalty_window
+
+
+@dataclass
+class _JobResult:
+    codes: torch.Tensor  # [1, 9, num_frames], audio prefix included
+    wav: np.ndarray  # [num_samples]
+    samples_per_frame: int
+
+
+class ZonosServer:
+    def __init__(self, model: Zonos, config: ServerConfig | None = None):
+        self.model = model
+        self.config = config or ServerConfig()
+        self.sampling_rate = model.autoencoder.sampling_rate
+        # A single worker: batches never run concurrently on the accelerator.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zonos-server")
+        self._queue: asyncio.Queue[_Job] | None = None
+        self._batcher: asyncio.Task | None = None
+        self._routes = {
+            ("GET", "/health"): self._health,
+            ("GET", "/metrics"): self._metrics,
+            ("POST", "/synthesize"): self._synthesize,
+            ("POST", "/stream"): self._stream,
+            ("POST", "/embed_speaker"): self._embed_speaker,
+        }
+
+    async def start(self) -> asyncio.Server:
+        """Start the batcher and listen; with `port=0` the bound port is in `server.sockets[0].getsockname()`."""
+        self._queue = asyncio.Queue(maxsize=self.config.max_queue_size)
+        self._batcher = asyncio.create_task(self._batch_loop())
+        return await asyncio.start_server(self._handle_connection, self.config.host, self.config.port)
+
+    async def serve_forever(self):
+        server = await self.start()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._batcher.cancel()
+            self._executor.shutdown(wait=True)
+
+    # HTTP plumbing. One request per connection, which keeps the parser trivial.
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, headers, body = await self._read_request(reader)
+            handler = self._routes.get((method, path))
+            if handler is None:
+                allowed = any(route_path == path for _, route_path in self._routes)
+                raise HTTPError(405 if allowed else 404, f"{method} {path}")
+            await handler(headers, body, writer)
+        except HTTPError as e:
+            await self._send_json(writer, {"error": str(e)}, status=e.status)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            await self._send_json(writer, {"error": f"{type(e).__name__}: {e}"}, status=500)
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> tuple[str, str, dict, bytes]:
+        try:
+            method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > self.config.max_body_bytes:
+            raise HTTPError(413, f"Body exceeds {self.config.max_body_bytes} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    @staticmethod
+    def _head(status: int, headers: dict[str, str]) -> bytes:
+        lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", "Connection: close"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send(self, writer: asyncio.StreamWriter, body: bytes, content_type: str, status: int = 200, **headers):
+        headers = {"Content-Type": content_type, "Content-Length": str(len(body))} | headers
+        writer.write(self._head(status, headers) + body)
+        await writer.drain()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, obj, status: int = 200, **headers):
+        await self._send(writer, json.dumps(obj).encode(), "application/json", status, **headers)
+
+    # Endpoints
+
+    async def _health(self, headers: dict, body: bytes, writer: asyncio.StreamWriter):
+        await self._send_json(writer, {"status": "ok", "queued": self._queue.qsize()})
+
+    async def _metrics(self, headers: dict, body: bytes, writer: asyncio.StreamWriter):
+        sinks = self.model.instrumentation.sinks if self.model.instrumentation is not None else []
+        prometheus = [sink for sink in sinks if isinstance(sink, PrometheusSink)]
+        if not prometheus:
+            raise HTTPError(404, "No PrometheusSink in model.instrumentation")
+        await self._send(writer, prometheus[0].render().encode(), "text/plain; version=0.0.4")
+
+    async def _synthesize(self, headers: dict, body: bytes, writer: asyncio.StreamWriter):
+        request = self._parse_json(body)
+        job = self._make_job(request, request.get("text", ""))
+        result = await self._run_job(job, admit=True)
+
+        buffer = io.BytesIO()
+        sf.write(buffer, result.wav, self.sampling_rate, format="WAV")
+        await self._send(writer, buffer.getvalue(), "audio/wav", **{"X-Seed": str(job.seed)})
+
+    async def _stream(self, headers: dict, body: bytes, writer: asyncio.StreamWriter):
+        request = self._parse_json(body)
+        language = request.get("language", "en-us")
+        loop = asyncio.get_running_loop()
+        # On the model's worker: the phonemizer backends are shared with the conditioner and not thread-safe.
+        chunks = await loop.run_in_executor(
+            self._executor, split_text_by_phonemes, request.get("text", ""), language, self.config.stream_max_phonemes
+        )
+        if not chunks:
+            raise HTTPError(400, "No text to synthesize")
+
+        audio_prefix_codes = None
+        started = False
+        try:
+            for i, text in enumerate(continuation_texts(chunks)):
+                job = self._make_job(request, text, audio_prefix_codes)
+                # Only the first chunk goes through admission control: once a stream has started it is finished,
+                # waiting for queue space instead of failing halfway through.
+                result = await self._run_job(job, admit=i == 0)
+                if not started:
+                    head = {"Content-Type": "audio/L16", "Transfer-Encoding": "chunked"}
+                    writer.write(self._head(200, head | {"X-Sample-Rate": str(self.sampling_rate)}))
+                    started = True
+
+                prefix_len = 0 if audio_prefix_codes is None else audio_prefix_codes.shape[2]
+                wav = result.wav[prefix_len * result.samples_per_frame :]
+                pcm = (np.clip(wav, -1, 1) * 32767).astype("<i2").tobytes()
+                writer.write(f"{len(pcm):X}\r\n".encode() + pcm + b"\r\n")
+                await writer.drain()
+                audio_prefix_codes = result.codes[..., prefix_len:]
+        except Exception:
+            if not started:
+                raise
+            # The status line is out, so no error response can follow. Closing the connection with the chunked
+            # body unterminated tells the client the stream was cut short.
+            return
+
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _embed_speaker(self, headers: dict, body: bytes, writer: asyncio.StreamWriter):
+        if not body:
+            raise HTTPError(400, "Expected an audio file as the request body")
+        try:
+            data, sr = sf.read(io.BytesIO(body), dtype="float32", always_2d=True)
+        except Exception as e:
+            raise HTTPError(400, f"Could not read audio: {e}")
+        wav = torch.from_numpy(data.T.copy())
+
+        def embed() -> list[float]:
+            with torch.inference_mode():
+                return self.model.make_speaker_embedding(wav, sr).float().flatten().tolist()
+
+        loop = asyncio.get_running_loop()
+        try:
+            embedding = await asyncio.wait_for(
+                loop.run_in_executor(self._executor, embed), timeout=self.config.request_timeout_s
+            )
+        except asyncio.TimeoutError:
+            raise HTTPError(504, f"Request timed out after {self.config.request_timeout_s}s")
+        await self._send_json(writer, {"embedding": embedding})
+
+    # Jobs and batching
+
+    @staticmethod
+    def _parse_json(body: bytes) -> dict:
+        try:
+            request = json.loads(body)
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid JSON: {e}")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "Expected a JSON object")
+        return request
+
+    def _make_job(self, request: dict, text: str, audio_prefix_codes: torch.Tensor | None = None) -> _Job:
+        if not text.strip():
+            raise HTTPError(400, "No text to synthesize")
+        speaker = request.get("speaker")
+        if speaker is not None:
+            speaker = torch.tensor(speaker, dtype=torch.bfloat16).view(1, -1)
+        try:
+            cond_dict = make_cond_dict(
+                text=text,
+                language=request.get("language", "en-us"),
+                speaker=speaker,
+                device=self.model.device,
+                **request.get("conditioning", {}),
+            )
+        except (AssertionError, TypeError, ValueError) as e:
+            raise HTTPError(400, f"Invalid conditioning: {e}")
+
+        # Checked here rather than left to `generate`, where a bad request would fail the whole batch it joined.
+        sampling_params = request.get("sampling_params", dict(min_p=0.1))
+        if not isinstance(sampling_params, dict) or not all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in sampling_params.values()
+        ):
+            raise HTTPError(400, "sampling_params must be an object of numbers")
+        try:
+            collated = collate_sampling_params([sampling_params])
+            seed = request.get("seed")
+            seed = random.randrange(2**63) if seed is None else int(seed)
+            cfg_scale = float(request.get("cfg_scale", 2.0))
+            max_new_tokens = int(request.get("max_new_tokens", self.config.max_new_tokens))
+        except (TypeError, ValueError) as e:
+            raise HTTPError(400, f"Invalid request: {e}")
+        if cfg_scale == 1.0:
+            raise HTTPError(400, "cfg_scale 1.0 is not supported")
+        if max_new_tokens < 1:
+            raise HTTPError(400, "max_new_tokens must be at least 1")
+
+        return _Job(
+            cond_dict=cond_dict,
+            seed=seed,
+            sampling_params=sampling_params,
+            repetition_penalty_window=int(collated["repetition_penalty_window"]),
+            cfg_scale=cfg_scale,
+            max_new_tokens=min(max_new_tokens, self.config.max_new_tokens),
+            audio_prefix_codes=audio_prefix_codes,
+            future=asyncio.get_running_loop().create_future(),
+        )
+
+    async def _run_job(self, job: _Job, admit: bool) -> _JobResult:
+        if admit:
+            try:
+                self._queue.put_nowait(job)
+            except asyncio.QueueFull:
+                raise HTTPError(503, "Server is busy, try again later")
+        else:
+            await self._queue.put(job)
+        try:
+            # On timeout the future is cancelled, so the batcher skips the job if it has not started yet.
+            return await asyncio.wait_for(job.future, timeout=self.config.request_timeout_s)
+        except asyncio.TimeoutError:
+            job.cancel_token.cancel()
+            raise HTTPError(504, f"Request timed out after {self.config.request_timeout_s}s")
+
+    async def _next_jobs(self) -> list[_Job]:
+        """Wait for a job, then collect whatever else arrives within `max_batch_wait_ms`."""
+        loop = asyncio.get_running_loop()
+        jobs = [await self._queue.get()]
+        deadline = loop.time() + self.config.max_batch_wait_ms / 1000
+        while len(jobs) < self.config.max_batch_size:
+            try:
+                jobs.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            if (timeout := deadline - loop.time()) <= 0:
+                break
+            try:
+                jobs.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return jobs
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            groups: dict[tuple, list[_Job]] = {}
+            for job in await self._next_jobs():
+                if not job.future.done():
+                    groups.setdefault(job.batch_key, []).append(job)
+
+            for group in groups.values():
+                group = [job for job in group if not job.future.done()]
+                if not group:
+                    continue
+                try:
+                    results = await loop.run_in_executor(self._executor, self._run_batch, group)
+                except Exception as e:
+                    for job in group:
+                        if not job.future.done():
+                            job.future.set_exception(e)
+                    continue
+                for job, result in zip(group, results):
+                    if not job.future.done():
+                        job.future.set_result(result)
+
+    def _run_batch(self, jobs: list[_Job]) -> list[_JobResult]:
+        """
+        One `generate` call per conditioning length. Padding a shorter row to the batch's length changes its
+        audio, and a seeded request must give the same result whatever it was batched with.
+        """
+        model = self.model
+        with torch.inference_mode():
+            conditionings = [model.prepare_conditioning(job.cond_dict) for job in jobs]
+        by_length: dict[int, list[int]] = {}
+        for i, conditioning in enumerate(conditionings):
+            by_length.setdefault(conditioning.shape[1], []).append(i)
+
+        results: list[_JobResult | None] = [None] * len(jobs)
+        for indices in by_length.values():
+            conditioning = model.batch_conditioning([conditionings[i] for i in indices])
+            for i, result in zip(indices, self._generate([jobs[i] for i in indices], conditioning)):
+                results[i] = result
+        return results
+
+    def _generate(self, jobs: list[_Job], conditioning: torch.Tensor) -> list[_JobResult]:
+        model, first = self.model, jobs[0]
+
+        def callback(frame: torch.Tensor, step: int, max_steps: int) -> bool:
+            # Stop once no one is waiting for the batch anymore, rather than holding the accelerator.
+            if all(job.cancel_token.cancelled for job in jobs):
+                raise GenerationCancelled()
+            return True
+        with torch.inference_mode():
+            audio_prefix_codes = None
+            if first.audio_prefix_codes is not None:
+                audio_prefix_codes = torch.cat([job.audio_prefix_codes for job in jobs]).to(model.device)
+            codes, lengths = model.generate(
+                conditioning,
+                audio_prefix_codes=audio_prefix_codes,
+                max_new_tokens=first.max_new_tokens,
+                cfg_scale=first.cfg_scale,
+                batch_size=len(jobs),
+                sampling_params=[job.sampling_params for job in jobs],
+                progress_bar=False,
+                generator=make_generators([job.seed for job in jobs], model.device),
+                callback=callback,
+                return_lengths=True,
+            )
+            wavs = model.autoencoder.decode(codes).cpu()
+
+        codes = codes.cpu()
+        samples_per_frame = wavs.shape[-1] // codes.shape[-1]
+        return [
+            _JobResult(codes[i : i + 1, :, :n], wavs[i, 0, : n * samples_per_frame].numpy(), samples_per_frame)
+            for i, n in enumerate(lengths.tolist())
+        ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    defaults = ServerConfig()
+    parser.add_argument("--model", default="Zyphra/Zonos-v0.1-transformer")
+    parser.add_argument("--device", default=DEFAULT_DEVICE)
+    parser.add_argument("--host", default=defaults.host)
+    parser.add_argument("--port", type=int, default=defaults.port)
+    parser.add_argument("--max-batch-size", type=int, default=defaults.max_batch_size)
+    parser.add_argument("--max-batch-wait-ms", type=float, default=defaults.max_batch_wait_ms)
+    parser.add_argument("--max-queue-size", type=int, default=defaults.max_queue_size)
+    parser.add_argument("--request-timeout", type=float, default=defaults.request_timeout_s)
+    parser.add_argument("--metrics", action="store_true", help="Instrument generate and serve GET /metrics.")
+    args = parser.parse_args()
+
+    model = Zonos.from_pretrained(args.model, device=args.device)
+    model.requires_grad_(False).eval()
+    if args.metrics:
+        model.instrumentation = Instrumentation([PrometheusSink()])
+    config = ServerConfig(
+        host=args.host,
+        port=args.port,
+        max_batch_size=args.max_batch_size,
+        max_batch_wait_ms=args.max_batch_wait_ms,
+        max_queue_size=args.max_queue_size,
+        request_timeout_s=args.request_timeout,
+    )
+    print(f"Serving {args.model} on http://{args.host}:{args.port}")
+    asyncio.run(ZonosServer(model, config).serve_forever())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+import torch
+import torch.multiprocessing as mp
+
+from zonos.conditioning import make_cond_dict
+from zonos.model import Zonos
+from zonos.pipeline import SynthesisRequest, SynthesisResult
+from zonos.sampling import make_generators
+
+_STOP = None
+_LIVENESS_INTERVAL = 1.0  # seconds between checks that no worker has died
+
+
+def _synthesize(model: Zonos, request: SynthesisRequest) -> SynthesisResult:
+    with torch.inference_mode():
+        cond_dict = make_cond_dict(
+            text=request.text, language=request.language, speaker=request.speaker, device="cpu", **request.cond_kwargs
+        )
+        conditioning = model.prepare_conditioning(cond_dict)
+        generate_kwargs = dict(progress_bar=False) | request.generate_kwargs
+        if request.seed is not None:
+            generate_kwargs["generator"] = make_generators([request.seed], "cpu")
+        codes = model.generate(conditioning, audio_prefix_codes=request.audio_prefix_codes, **generate_kwargs)
+        wav = model.autoencoder.decode(codes)[0, 0].numpy() if request.decode else None
+    return SynthesisResult(request, model.autoencoder.sampling_rate, wav, codes)
+
+
+def _worker_main(model: Zonos, cores: list[int] | None, num_threads: int, tasks: mp.Queue, results: mp.Queue):
+    if cores is not None:
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(num_threads)
+
+    while (task := tasks.get()) is not _STOP:
+        task_id, request = task
+        try:
+            results.put((task_id, _synthesize(model, request), None))
+        except Exception as e:
+            # Exceptions don't necessarily pickle; the message is enough to report the failure.
+            results.put((task_id, None, f"{type(e).__name__}: {e}"))
+
+
+class CPUWorkerPool:
+    """
+    Runs requests on `num_workers` processes, each with its own `torch` thread pool, for CPU hosts where a
+    single `generate` can't keep all cores busy.
+
+    The model's weights (DAC included) are moved to shared memory once and mapped by every worker rather than
+    copied, so N workers cost one model's worth of memory. Each worker gets `threads_per_worker` intra-op
+    threads and, where the OS supports it, is pinned to its own set of cores. Workers pull requests from one
+    queue as they finish, so long and short sentences balance out.
+
+    Same interface as `SynthesisPipeline`: `submit` returns a `concurrent.futures.Future` resolving to a
+    `SynthesisResult`. `output_path` on requests is ignored.
+
+    Workers are spawned, never forked: forking a process that already runs torch's thread pools (or a web
+    server's threads) can deadlock the children. Spawning is correspondingly slow, so keep one pool for the
+    lifetime of the model instead of one per batch of requests. If a worker dies (e.g. killed for running out
+    of memory), the pool is broken: every pending future fails and `submit` raises, as with
+    `concurrent.futures.ProcessPoolExecutor`.
+    """
+
+    def __init__(self, model: Zonos, num_workers: int | None = None, threads_per_worker: int | None = None):
+        if model.device.type != "cpu":
+            raise ValueError(f"CPUWorkerPool needs a model on CPU, got {model.device}")
+        self.model = model
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+        num_cores = len(cores) if cores is not None else os.cpu_count()
+        self.num_workers = num_workers or max(1, num_cores // 4)
+        self.threads_per_worker = threads_per_worker or max(1, num_cores // self.num_workers)
+
+        model.share_memory()
+        model.autoencoder.dac.share_memory()
+
+        # Not forkserver either: it hands new processes at most 256 file descriptors, one per shared tensor.
+        ctx = mp.get_context("spawn")
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._workers = []
+        for i in range(self.num_workers):
+            worker_cores = None
+            if cores is not None:
+                start = i * self.threads_per_worker % num_cores
+                worker_cores = cores[start : start + self.threads_per_worker] or cores
+            process = ctx.Process(
+                target=_worker_main,
+                args=(model, worker_cores, self.threads_per_worker, self._tasks, self._results),
+                name=f"zonos-worker-{i}",
+                daemon=True,
+            )
+            process.start()
+            self._workers.append(process)
+
+        self._futures: dict[int, Future] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self.broken: str | None = None  # why the pool stopped working, once a worker has died
+        self._collector = threading.Thread(target=self._collect, name="zonos-worker-results", daemon=True)
+        self._collector.start()
+
+    def submit(self, request: SynthesisRequest) -> Future:
+        if self._closed:
+            raise RuntimeError("CPUWorkerPool is closed")
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            if self.broken is not None:
+                raise RuntimeError(self.broken)
+            task_id, self._next_id = self._next_id, self._next_id + 1
+            self._futures[task_id] = future
+        self._tasks.put((task_id, request))
+        return future
+
+    def close(self):
+        """Finish all submitted requests, then stop the workers."""
+        if self._closed:
+            return
+        self._closed = True
+        if self.broken is None:
+            for _ in self._workers:
+                self._tasks.put(_STOP)
+        for process in self._workers:
+            if self.broken is not None:
+                process.terminate()  # a dead worker may have left the task queue's lock held
+            process.join()
+        self._results.put(_STOP)
+        self._collector.join()
+
+    def __enter__(self) -> "CPUWorkerPool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _collect(self):
+        while True:
+            try:
+                item = self._results.get(timeout=_LIVENESS_INTERVAL)
+            except queue.Empty:
+                dead = [p for p in self._workers if p.exitcode is not None]
+                if dead and not self._closed and self.broken is None:  # workers exit by themselves on close
+                    self._fail_pending(f"{dead[0].name} exited with code {dead[0].exitcode}")
+                continue
+            if item is _STOP:
+                return
+            task_id, result, error = item
+            with self._lock:
+                future = self._futures.pop(task_id, None)
+            if future is None:
+                continue  # already failed when a worker died
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def _fail_pending(self, reason: str):
+        with self._lock:
+            self.broken = f"A CPUWorkerPool worker died ({reason}); the pool can't be used anymore"
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.set_exception(RuntimeError(self.broken))